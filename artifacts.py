@@ -0,0 +1,116 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+
+def file_hash(path):
+    "Gets the sha256 hash of the contents of a file"
+    sha = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def code_hash(directory):
+    """Gets a hash of every python module in a folder, so a change to any
+        module a stage uses (e.g. selection.py or fuzzy_match.py), not
+        just the one it is defined in, changes its key"""
+    sha = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            sha.update(name.encode("utf-8"))
+            sha.update(file_hash(os.path.join(directory, name)).encode())
+    return sha.hexdigest()
+
+
+class ArtifactStore:
+    """Keeps the outputs of each pipeline stage on disk, so that a stage
+        whose inputs have not changed does not need to be run again.
+
+        The outputs are stored with a key, which is a hash of everything
+        the stage depends on: the config keys it reads, the contents of
+        its source files (such as the manually edited Excel files and
+        the cached remote files), the keys of the stages that made its
+        inputs and the code of every module in the folder of the module
+        it is defined in. If the key
+        of a stage is the same as the stored one, the stored outputs are
+        loaded instead of running the stage. Only the latest outputs of
+        each stage are kept.
+
+    Args:
+        store_dir (str): the folder in which the outputs are kept
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Builds the store from the artifacts section of the config, or
+            returns None if storing artifacts is switched off."""
+        artifact_config = config.get('artifacts') or {}
+        if not artifact_config.get('enabled', True):
+            return None
+        return cls(artifact_config.get('store_dir', '.artifacts'))
+
+    def _paths(self, stage_name):
+        artifact_path = os.path.join(self.store_dir, f"{stage_name}.pkl")
+        key_path = os.path.join(self.store_dir, f"{stage_name}.key")
+        return artifact_path, key_path
+
+    @staticmethod
+    def stage_key(ctx, stage, upstream_keys: dict) -> str:
+        """Makes the key of a stage from everything its outputs depend on.
+
+        Args:
+            ctx (RunContext): the config and resources of this run
+            stage (Stage): the stage to make the key for
+            upstream_keys (dict): the keys of the stages that make each of
+                the inputs of this stage, by input name
+
+        Returns:
+            str: a hash of the stage's inputs
+        """
+        sources = stage.sources(ctx) if stage.sources else []
+        key_parts = {
+            "stage": stage.name,
+            "code": code_hash(os.path.dirname(os.path.abspath(
+                inspect.getsourcefile(stage.func)))),
+            "config": {key: ctx.config.get(key)
+                       for key in stage.config_keys},
+            "sources": [file_hash(path) for path in sources],
+            "inputs": upstream_keys,
+        }
+        key_json = json.dumps(key_parts, sort_keys=True, default=str)
+        return hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+
+    def load(self, stage_name, key):
+        """Gets the stored outputs of a stage if they were stored with
+            the same key, otherwise None."""
+        artifact_path, key_path = self._paths(stage_name)
+        try:
+            with open(key_path) as key_file:
+                if key_file.read() != key:
+                    return None
+            with open(artifact_path, "rb") as artifact_file:
+                return pickle.load(artifact_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save(self, stage_name, key, outputs: dict):
+        """Stores the outputs of a stage with its key, replacing any
+            outputs stored before."""
+        artifact_path, key_path = self._paths(stage_name)
+        # The key is removed first and written last, so a key on disk
+        # always belongs to a complete artifact.
+        if os.path.exists(key_path):
+            os.remove(key_path)
+        with open(artifact_path, "wb") as artifact_file:
+            pickle.dump(outputs, artifact_file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        with open(key_path, "w") as key_file:
+            key_file.write(key)
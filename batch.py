@@ -0,0 +1,140 @@
+import contextlib
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from artifacts import ArtifactStore
+from instrumentation import StageRecorder
+from pipeline import RunContext, run_stages
+from scheduler import schedule_summary
+
+# The result of running the pipeline for one platform: its name, the folder
+# its outputs were written to, the rows of each dataframe it made and a
+# description of the error that stopped it, if any
+PlatformResult = namedtuple("PlatformResult",
+                            ["name", "output_dir", "rows", "error"])
+
+
+def platform_config(config: dict, platform: dict) -> dict:
+    """Makes the config of one platform: the shared config with the
+        platform's own settings (such as meta_url, disag_url and
+        URL_prefix) on top. Its outputs, stored stage outputs and run
+        report go in folders named after the platform.
+
+    Args:
+        config (dict): the loaded config file
+        platform (dict): an entry of the platforms list in the config,
+            which must have a name
+
+    Returns:
+        dict: the config for the platform
+    """
+    name = platform['name']
+    merged = {**config, **platform}
+    merged['output_dir'] = os.path.join(config.get('output_dir', 'outputs'),
+                                        name)
+    artifacts = config.get('artifacts') or {}
+    merged['artifacts'] = {**artifacts,
+                           'store_dir': os.path.join(
+                               artifacts.get('store_dir', '.artifacts'),
+                               name)}
+    # The code mapping cannot be chosen interactively from a worker process
+    merged['manually_choose_code_mapping'] = False
+    return merged
+
+
+def run_platform(config: dict, stage_names: list, shared_state: dict):
+    """Runs the selected stages for one platform, in a worker process.
+        Everything the stages print goes to run.log in the platform's
+        output folder.
+
+    Args:
+        config (dict): the config of the platform, from platform_config
+        stage_names (list): the names of the stages to run
+        shared_state (dict): outputs shared by all platforms, such as the
+            parsed DSD, so they are not made again
+
+    Returns:
+        PlatformResult: what the run made, or the error that stopped it
+    """
+    from main import STAGES, print_schedule
+
+    ctx = RunContext(config)
+    os.makedirs(ctx.output_dir, exist_ok=True)
+    # Stages whose outputs are all shared (load_dsd) are not run again
+    selected = [stage for stage in STAGES
+                if stage.name in stage_names
+                and not all(name in shared_state for name in stage.provides)]
+    log_path = ctx.out_path("run.log")
+    timings = {}
+    start = time.perf_counter()
+    with open(log_path, "w") as log_file, \
+            contextlib.redirect_stdout(log_file):
+        try:
+            recorder = StageRecorder.from_config(config,
+                                                 report_dir=ctx.output_dir)
+            state = run_stages(STAGES, ctx, selected,
+                               state=dict(shared_state),
+                               store=ArtifactStore.from_config(config),
+                               recorder=recorder,
+                               max_workers=config['scheduler']['max_workers'],
+                               timings=timings)
+            schedule = schedule_summary(STAGES, timings,
+                                        time.perf_counter() - start)
+            print_schedule(schedule)
+            if recorder is not None:
+                recorder.schedule = schedule
+                recorder.write(ctx.http_cache.summary())
+        except Exception as ex:
+            print(f"The run stopped with an error: {ex!r}")
+            return PlatformResult(config['name'], ctx.output_dir, {},
+                                  repr(ex))
+    rows = {name: len(value) for name, value in state.items()
+            if name not in shared_state and hasattr(value, "shape")}
+    return PlatformResult(config['name'], ctx.output_dir, rows, None)
+
+
+def run_batch(config: dict, selected: list, max_workers=None) -> list:
+    """Runs the selected stages for every platform in the platforms list
+        of the config, in a pool of processes, one platform per process.
+
+        The DSD is shared by all platforms, so it is downloaded and parsed
+        once, here, before the platforms are run.
+
+    Args:
+        config (dict): the loaded config file
+        selected (list): the stages to run
+        max_workers (int): the most platforms that are run at one time.
+            None means one per CPU.
+
+    Raises:
+        ValueError: if there are no platforms in the config, or two have
+            the same name
+
+    Returns:
+        list: a PlatformResult for each platform, in the order of the
+            platforms list
+    """
+    from main import load_dsd
+
+    platforms = config.get('platforms') or []
+    names = [platform['name'] for platform in platforms]
+    if not platforms:
+        raise ValueError("There are no platforms in the config to run")
+    if len(set(names)) != len(names):
+        raise ValueError(f"The platform names must be unique: {names}")
+
+    shared_state = load_dsd(RunContext(config))
+    stage_names = [stage.name for stage in selected]
+    configs = [platform_config(config, platform) for platform in platforms]
+    # Spawned rather than forked, as the parent may have threads (e.g. of
+    # the connection pool) holding locks
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn")
+                             ) as executor:
+        futures = [executor.submit(run_platform, platform_config_,
+                                   stage_names, shared_state)
+                   for platform_config_ in configs]
+        return [future.result() for future in futures]
@@ -0,0 +1,303 @@
+"""Benchmarks each stage of the pipeline against recorded copies of the
+remote files, served from a local web server, so runs can be compared
+without depending on the live sites.
+
+    python benchmark.py record            # copy the remote files once
+    python benchmark.py scale --factor 10 # make a 10x synthetic copy
+    python benchmark.py run --scale 1 10 --output benchmark_results.json
+
+Use `run --compare old_results.json` to fail (exit code 1) if any stage
+has become slower than in an earlier run.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import main
+from pipeline import RunContext, load_config, run_stages
+
+FIXTURES_DIR = "benchmark_fixtures"
+# The config keys holding remote URLs. URL_prefix is the start of the URL
+# of every disaggregation values csv.
+URL_KEYS = ("meta_url", "disag_url", "dsd_url", "URL_prefix")
+
+
+def _basename(url):
+    return url.rstrip("/").rsplit("/", 1)[-1]
+
+
+def _scale_dir(fixtures_dir, factor):
+    return os.path.join(fixtures_dir, f"x{factor}")
+
+
+def record_fixtures(config: dict, fixtures_dir=FIXTURES_DIR):
+    """Downloads (through the http cache) the meta data, disaggregation
+        report, DSD and every disaggregation values csv into the x1
+        fixtures folder, named as the last part of their URLs.
+
+    Args:
+        config (dict): the loaded config file
+        fixtures_dir (str): the folder of the fixtures
+    """
+    from fetching import fetch_many
+
+    record_dir = _scale_dir(fixtures_dir, 1)
+    os.makedirs(record_dir, exist_ok=True)
+    http_cache = RunContext(config).http_cache
+    urls = [config['meta_url'], config['disag_url'], config['dsd_url'],
+            *main.get_mapped_columns(config).disag_val_urls]
+    for result in fetch_many(urls, http_cache.fetch):
+        if result.error is not None:
+            print(f"Could not record {result.url}: {result.error}")
+            continue
+        shutil.copyfile(result.value,
+                        os.path.join(record_dir, _basename(result.url)))
+    print(f"Recorded {len(os.listdir(record_dir))} files in {record_dir}")
+
+
+def _scale_indicator(indicator, copy):
+    """Makes a new indicator id for a copy of an indicator by adding
+        100 * copy to its goal, e.g. 1-2-1 becomes 101-2-1"""
+    goal, _, rest = str(indicator).partition("-")
+    if not goal.isdigit() or copy == 0:
+        return indicator
+    return f"{int(goal) + 100 * copy}-{rest}"
+
+
+def scale_fixtures(config: dict, factor: int, fixtures_dir=FIXTURES_DIR):
+    """Makes a synthetic copy of the recorded fixtures with factor times as
+        many indicators (and rows in the disaggregation report) and factor
+        times as many values in each disaggregation values csv. The DSD is
+        copied as it is.
+
+    Args:
+        config (dict): the loaded config file
+        factor (int): how many times bigger to make the fixtures
+        fixtures_dir (str): the folder of the fixtures
+    """
+    source_dir = _scale_dir(fixtures_dir, 1)
+    target_dir = _scale_dir(fixtures_dir, factor)
+    os.makedirs(target_dir, exist_ok=True)
+    copies = range(factor)
+
+    with open(os.path.join(source_dir, _basename(config['meta_url']))) as f:
+        meta = json.load(f)
+    scaled_meta = {_scale_indicator(indicator, copy): indicator_meta
+                   for copy in copies
+                   for indicator, indicator_meta in meta.items()}
+    with open(os.path.join(target_dir,
+                           _basename(config['meta_url'])), "w") as f:
+        json.dump(scaled_meta, f)
+
+    disag_name = _basename(config['disag_url'])
+    disag_df = pd.read_csv(os.path.join(source_dir, disag_name))
+    indicators = disag_df.Indicator.str.lstrip("#")
+    disag_df = pd.concat(
+        [disag_df.assign(Indicator="#" + indicators.map(
+            partial(_scale_indicator, copy=copy)))
+         for copy in copies],
+        ignore_index=True)
+    disag_df.to_csv(os.path.join(target_dir, disag_name), index=False)
+
+    dsd_name = _basename(config['dsd_url'])
+    shutil.copyfile(os.path.join(source_dir, dsd_name),
+                    os.path.join(target_dir, dsd_name))
+
+    values_prefix = _basename(config['URL_prefix'])
+    for file_name in os.listdir(source_dir):
+        if not file_name.startswith(values_prefix):
+            continue
+        values_df = pd.read_csv(os.path.join(source_dir, file_name))
+        values = values_df.Value.astype(str)
+        values_df = pd.concat(
+            [values_df.assign(Value=values if copy == 0
+                              else values + f" ({copy})")
+             for copy in copies],
+            ignore_index=True)
+        values_df.to_csv(os.path.join(target_dir, file_name), index=False)
+    print(f"Made {factor}x fixtures in {target_dir}")
+
+
+@contextlib.contextmanager
+def serve(directory):
+    """Serves a folder on a free local port for as long as the context is
+        open, and gives its base URL"""
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 partial(QuietHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _rows(outputs: dict) -> dict:
+    "Gets the number of rows of every dataframe output of a stage"
+    return {name: len(value) for name, value in outputs.items()
+            if isinstance(value, (pd.DataFrame, pd.Series))}
+
+
+def benchmark_scale(config: dict, fixtures_dir, repeats=3) -> list:
+    """Runs every stage of the pipeline, in order, against one set of
+        fixtures, timing each stage. Each repeat starts with empty caches
+        in a new working folder, so every file is downloaded and parsed.
+
+    Returns:
+        list: a dictionary for each stage with its times and the number
+            of rows it output
+    """
+    repo_dir = os.getcwd()
+    # The server must not follow the working folder when it changes below
+    fixtures_dir = os.path.abspath(fixtures_dir)
+    timings = {stage.name: [] for stage in main.STAGES}
+    rows = {}
+    with serve(fixtures_dir) as base_url:
+        for _ in range(repeats):
+            with tempfile.TemporaryDirectory() as work_dir:
+                shutil.copytree(os.path.join(repo_dir, "inputs"),
+                                os.path.join(work_dir, "inputs"))
+                os.makedirs(os.path.join(work_dir, "outputs"))
+                run_config = {
+                    **config,
+                    **{key: base_url + _basename(config[key])
+                       for key in URL_KEYS},
+                    "http_cache": {**config['http_cache'],
+                                   "cache_dir": ".http_cache",
+                                   "offline": False},
+                    "dsd_cache_dir": ".dsd_cache",
+                    "manually_choose_code_mapping": False}
+                os.chdir(work_dir)
+                try:
+                    ctx = RunContext(run_config)
+                    state = {}
+                    for stage in main.STAGES:
+                        before = set(state)
+                        start = time.perf_counter()
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            run_stages(main.STAGES, ctx, [stage],
+                                       state=state)
+                        timings[stage.name].append(time.perf_counter()
+                                                   - start)
+                        rows[stage.name] = _rows(
+                            {name: state[name] for name in stage.provides
+                             if name not in before})
+                finally:
+                    os.chdir(repo_dir)
+    return [{"stage": name,
+             "seconds": times,
+             "median_seconds": statistics.median(times),
+             "rows_out": rows[name]}
+            for name, times in timings.items()]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Finds the stages that are slower than in a baseline run by more
+        than the tolerance (0.2 is 20%)
+
+    Returns:
+        list: a description of each regression
+    """
+    baseline_times = {(scale["scale"], stage["stage"]):
+                      stage["median_seconds"]
+                      for scale in baseline["scales"]
+                      for stage in scale["stages"]}
+    regressions = []
+    for scale in results["scales"]:
+        for stage in scale["stages"]:
+            old = baseline_times.get((scale["scale"], stage["stage"]))
+            new = stage["median_seconds"]
+            if old is not None and new > old * (1 + tolerance):
+                regressions.append(f"x{scale['scale']} {stage['stage']}: "
+                                   f"{old:.3f}s -> {new:.3f}s")
+    return regressions
+
+
+def parse_args(argv=None):
+    "Parses the command line arguments"
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the pipeline stages against local copies "
+                    "of the remote files.")
+    parser.add_argument("command", choices=("record", "scale", "run"))
+    parser.add_argument("--config", default="config.yml",
+                        help="path to the config file")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR,
+                        help="folder of the recorded and scaled fixtures")
+    parser.add_argument("--factor", type=int, default=10,
+                        help="scale: how many times bigger to make the "
+                             "fixtures")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1],
+                        help="run: the scaled fixtures to run against")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="run: how many times to run each stage")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="run: the json file the results are written to")
+    parser.add_argument("--compare", metavar="RESULTS",
+                        help="run: an earlier results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="run: how much slower (0.2 is 20%%) a stage "
+                             "may be than in the compared results")
+    return parser.parse_args(argv)
+
+
+def run_benchmarks(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.command == "record":
+        return record_fixtures(config, args.fixtures)
+    if args.command == "scale":
+        return scale_fixtures(config, args.factor, args.fixtures)
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "repeats": args.repeat,
+        "scales": []}
+    for factor in args.scale:
+        fixtures_dir = _scale_dir(args.fixtures, factor)
+        if not os.path.isdir(fixtures_dir):
+            sys.exit(f"There are no {factor}x fixtures in {fixtures_dir}. "
+                     "Use the record and scale commands first.")
+        print(f"Benchmarking the {factor}x fixtures")
+        stages = benchmark_scale(config, fixtures_dir, args.repeat)
+        for stage in stages:
+            print(f"  {stage['stage']:<18} {stage['median_seconds']:8.3f}s "
+                  f"{stage['rows_out']}")
+        results["scales"].append({"scale": factor, "stages": stages})
+
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file),
+                                  args.tolerance)
+        for regression in regressions:
+            print(f"Slower: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
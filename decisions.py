@@ -0,0 +1,159 @@
+import csv
+import os
+
+import pandas as pd
+from rapidfuzz import fuzz, utils
+
+DECISION_COLS = ["column_name", "column_value", "sdmx_code", "comments"]
+
+
+class DecisionStore:
+    """Remembers which SDMX code was chosen for each SDG value of each
+        SDMX concept (column_name), so the same question is not asked
+        again when the SDG data are refreshed.
+
+        The decisions are kept in a csv file, which can be edited by hand.
+
+    Args:
+        path (str): the csv file of decisions. It is made if it does not
+            exist yet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._decisions = {}
+        if os.path.exists(path):
+            self.add_from_df(pd.read_csv(path, dtype=str,
+                                         keep_default_na=False))
+
+    def __len__(self):
+        return len(self._decisions)
+
+    def add_from_df(self, df: pd.DataFrame, comment=None, overwrite=True):
+        """Adds the decisions in a dataframe with column_name, column_value
+            and sdmx_code columns, such as the manually corrected Excel
+            file. A missing sdmx_code is a decision that there is no match.
+
+        Args:
+            df (pd.DataFrame): the decisions
+            comment (str): the comment to give every decision. If None the
+                comments column of df is used.
+            overwrite (bool): if False, decisions already in the store are
+                kept
+        """
+        codes = df.sdmx_code.where(df.sdmx_code.notna(), "None")
+        if comment is None:
+            comments = df.comments
+        else:
+            comments = [comment] * len(df)
+        for key, code, comments_ in zip(zip(df.column_name,
+                                            df.column_value),
+                                        codes, comments):
+            if overwrite or key not in self._decisions:
+                self._decisions[key] = (code, comments_)
+
+    def get(self, column_name, column_value):
+        "Gets the (sdmx_code, comments) decided for a value, or None"
+        return self._decisions.get((column_name, column_value))
+
+    def record(self, column_name, column_value, sdmx_code, comments):
+        "Remembers the decision for a value"
+        self._decisions[(column_name, column_value)] = (sdmx_code, comments)
+
+    def save(self):
+        "Writes all the decisions to the csv file"
+        rows = [(*key, *decision) for key, decision in self._decisions.items()]
+        pd.DataFrame(rows, columns=DECISION_COLS).to_csv(self.path,
+                                                         index=False)
+
+
+class DecisionJournal:
+    """A journal of the decisions made in an interactive session. Each
+        decision is written to the end of a csv file, and flushed to disk,
+        as soon as it is made, so a session that is stopped part way
+        through (a crash or Ctrl-C) can carry on from where it stopped.
+
+        The journal is removed when the session finishes and its decisions
+        have been saved to the DecisionStore.
+
+    Args:
+        path (str): the csv file of the journal
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def replay(self) -> pd.DataFrame:
+        """Reads the decisions from an earlier session that did not finish.
+
+        Returns:
+            pd.DataFrame: the decisions, with DECISION_COLS. Empty if there
+                is no journal.
+        """
+        if not os.path.exists(self.path):
+            return pd.DataFrame(columns=DECISION_COLS)
+        return pd.read_csv(self.path, dtype=str, keep_default_na=False)
+
+    def append(self, column_name, column_value, sdmx_code, comments):
+        "Writes a decision to the end of the journal"
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as journal_file:
+            writer = csv.writer(journal_file)
+            if new_file:
+                writer.writerow(DECISION_COLS)
+            writer.writerow([column_name, column_value, sdmx_code, comments])
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def remove(self):
+        "Removes the journal once its decisions have been saved"
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def auto_decision(column_value, possible_matches: list,
+                  code_name_dict: dict, auto_accept_score, min_score_margin):
+    """Decides the SDMX code of a value without asking the user, if the
+        answer is clear: either the value is the same as an SDMX name
+        (ignoring case and punctuation), or the best match scores at least
+        auto_accept_score and beats the next best by min_score_margin.
+
+        The suggestions are ranked with the partial ratio, under which a
+        short name found inside the value (e.g. "Asia" in "Asia,
+        regional") scores 100, so for this decision they are scored again
+        on the whole of both texts with the token sort ratio.
+
+    Args:
+        column_value (str): the SDG value to be matched
+        possible_matches (list): (SDMX name, score) of the best matches,
+            best first, as ranked for the suggestions
+        code_name_dict (dict): SDMX names --> SDMX codes for the column
+        auto_accept_score (int): the lowest score that is accepted. If
+            None, only exact matches are accepted.
+        min_score_margin (int): how much better than the next best match
+            the best match must be
+
+    Returns:
+        (str, str): the SDMX code and a comment, or None if the user must
+            choose
+    """
+    value_text = utils.default_process(str(column_value))
+    for name, _ in possible_matches:
+        if utils.default_process(name) == value_text:
+            return (code_name_dict[name],
+                    "Automatically matched; same as the SDMX name")
+    if auto_accept_score is None or not possible_matches:
+        return None
+    scored = sorted(((name,
+                      round(fuzz.token_sort_ratio(
+                          value_text, name,
+                          processor=utils.default_process)))
+                     for name, _ in possible_matches),
+                    key=lambda match: -match[1])
+    best_name, best_score = scored[0]
+    next_score = scored[1][1] if len(scored) > 1 else 0
+    if (best_score >= auto_accept_score
+            and best_score - next_score >= min_score_margin):
+        return (code_name_dict[best_name],
+                f"Automatically matched; scored {best_score}%")
+    return None
@@ -0,0 +1,106 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# What can have happened to a row of a mapping since it was published
+CHANGE_TYPES = ("added", "removed", "changed")
+
+
+def read_published(path, columns: list) -> pd.DataFrame:
+    """Reads a published (tab separated) mapping as text. If it has not
+        been published yet, the mapping is empty.
+
+    Args:
+        path (str): the published mapping file
+        columns (list): the columns of the mapping
+
+    Returns:
+        pd.DataFrame: the mapping, with missing values as ""
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=columns, dtype=str)
+    return pd.read_csv(path, sep="\t", dtype=str, keep_default_na=False,
+                       usecols=lambda col: col in columns)
+
+
+def _as_text(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """Makes the columns text, with missing values as "", as they are when
+        a mapping is read back from its file"""
+    return pd.DataFrame({col: df[col].astype(object).where(df[col].notna(),
+                                                           "").astype(str)
+                         for col in columns})
+
+
+def diff_mapping(old_df: pd.DataFrame, new_df: pd.DataFrame,
+                 keys: list, value_cols: list) -> pd.DataFrame:
+    """Finds the rows of a mapping that have been added, removed or
+        changed, by joining the old and new mappings on their keys (a hash
+        join), so each row is only compared with its match. If a key is in
+        a mapping more than once, its rows are paired in order.
+
+    Args:
+        old_df (pd.DataFrame): the published mapping
+        new_df (pd.DataFrame): the mapping made in this run
+        keys (list): the columns that identify a row, e.g. Text and
+            Dimension
+        value_cols (list): the columns compared, e.g. Value
+
+    Returns:
+        pd.DataFrame: the keys and change (one of CHANGE_TYPES) of each
+            row that is different, with the old and new values of the
+            value columns (old_<column> and <column>)
+    """
+    columns = [*keys, *value_cols]
+    old_df, new_df = _as_text(old_df, columns), _as_text(new_df, columns)
+    join_keys = [*keys, "occurrence"]
+    old_df["occurrence"] = old_df.groupby(keys).cumcount()
+    new_df["occurrence"] = new_df.groupby(keys).cumcount()
+    joined = old_df.merge(new_df, on=join_keys, how="outer",
+                          suffixes=("_old", ""), indicator=True)
+
+    differs = np.zeros(len(joined), dtype=bool)
+    for col in value_cols:
+        differs |= (joined[f"{col}_old"] != joined[col]).to_numpy()
+    change = np.select([joined._merge.eq("right_only"),
+                        joined._merge.eq("left_only"),
+                        differs],
+                       CHANGE_TYPES, default="")
+    joined = joined.assign(change=change)
+    delta_df = joined[joined.change != ""]
+    old_cols = [f"old_{col}" for col in value_cols]
+    delta_df = delta_df.rename(columns={f"{col}_old": old_col
+                                        for col, old_col in zip(value_cols,
+                                                                old_cols)})
+    return (delta_df[[*keys, "change", *old_cols, *value_cols]]
+            .sort_values([*keys, "change"])
+            .reset_index(drop=True))
+
+
+def summarise(delta_df: pd.DataFrame, n_rows: int) -> dict:
+    """Counts the rows of a delta of each type of change, and the rows of
+        the new mapping that are unchanged
+
+    Args:
+        delta_df (pd.DataFrame): the delta from diff_mapping
+        n_rows (int): the number of rows in the new mapping
+    """
+    counts = delta_df.change.value_counts()
+    summary = {change: int(counts.get(change, 0)) for change in CHANGE_TYPES}
+    summary["unchanged"] = n_rows - summary["added"] - summary["changed"]
+    return summary
+
+
+def publish(paths: list, published_dir):
+    """Copies the mappings made in a run to the published folder, so the
+        next run in delta mode is compared against them.
+
+    Args:
+        paths (list): the mapping files
+        published_dir (str): the folder of published mappings
+    """
+    os.makedirs(published_dir, exist_ok=True)
+    for path in paths:
+        shutil.copyfile(path, os.path.join(published_dir,
+                                           os.path.basename(path)))
@@ -0,0 +1,138 @@
+import os
+import pickle
+
+import pandas as pd
+
+from artifacts import file_hash
+
+CONCEPT_SCHEME_SHEET = "3.Concept Scheme"
+# Bump this if the structure of DSDIndex changes, so old cached indexes
+# are not loaded
+INDEX_VERSION = 1
+
+
+class DSDIndex:
+    """The parts of the International DSD workbook that the pipeline uses,
+        parsed once into dictionaries:
+
+            concept name --> (concept ID, codelist ID)
+            codelist ID --> {SDMX name: SDMX code}
+
+        so that every lookup is a dictionary lookup rather than a search of
+        a sheet. Use load_dsd_index rather than making a DSDIndex, so the
+        workbook is only parsed once for each version of the DSD.
+
+    Args:
+        concepts (dict): concept name (English) --> (concept ID,
+            codelist ID or "Uncoded")
+        codelists (dict): codelist ID --> {SDMX name: SDMX code}
+    """
+
+    def __init__(self, concepts: dict, codelists: dict):
+        self.concepts = concepts
+        self.codelists = codelists
+
+    def concept_id(self, concept_name):
+        "Gets the concept ID of a concept name, or None if it is not found"
+        concept = self.concepts.get(concept_name)
+        return concept[0] if concept else None
+
+    def codelist_id(self, concept_name):
+        """Gets the codelist ID (the tab name in the workbook) of a concept
+            name, or None if it is not found"""
+        concept = self.concepts.get(concept_name)
+        return concept[1] if concept else None
+
+    def code_names(self, concept_name):
+        """Gets the SDMX names --> SDMX codes of the codelist of a concept
+            name, or None if the concept is not found or is uncoded"""
+        return self.codelists.get(self.codelist_id(concept_name))
+
+    def concept_ids(self) -> dict:
+        "Gets every concept name --> concept ID"
+        return {name: concept[0] for name, concept in self.concepts.items()}
+
+    def codes_by_concept_id(self) -> dict:
+        """Gets every concept ID --> the set of SDMX codes in its codelist,
+            or None if the concept is uncoded or its codelist tab was not
+            found"""
+        codes = {}
+        for concept_id, codelist_id in self.concepts.values():
+            codelist = self.codelists.get(codelist_id)
+            if codes.get(concept_id) is None:
+                codes[concept_id] = (None if codelist is None
+                                     else {str(code)
+                                           for code in codelist.values()})
+        return codes
+
+
+def parse_dsd(dsd_path) -> DSDIndex:
+    """Parses the concept scheme and every codelist tab of the DSD workbook.
+        The workbook is opened once and each sheet is only read once.
+
+    Args:
+        dsd_path (str): path of the DSD workbook (.xlsm)
+
+    Returns:
+        DSDIndex: the parsed concepts and codelists
+    """
+    dsd_xls = pd.ExcelFile(dsd_path, engine="openpyxl")
+    concept_sch = pd.read_excel(dsd_xls,
+                                sheet_name=CONCEPT_SCHEME_SHEET,
+                                skiprows=11,
+                                header=0,
+                                usecols=[1, 2, 7])
+    concept_sch = concept_sch.dropna(subset=["Concept Name:en"])
+
+    concepts = {}
+    for concept_name, concept_id, codelist_id in zip(
+            concept_sch["Concept Name:en"],
+            concept_sch["Concept ID"],
+            concept_sch["Code List or Uncoded"]):
+        # As before, the first row of a concept name is the one used
+        concepts.setdefault(concept_name, (concept_id, codelist_id))
+
+    sheet_names = set(dsd_xls.sheet_names)
+    codelists = {}
+    for _, codelist_id in concepts.values():
+        if (not isinstance(codelist_id, str)
+                or codelist_id in codelists
+                or codelist_id.upper() not in sheet_names):
+            continue
+        # Column 0 is the SDMX code, 4 is the SDMX name (more human friendly)
+        codelist_df = pd.read_excel(dsd_xls,
+                                    sheet_name=codelist_id.upper(),
+                                    skiprows=12,
+                                    header=0,
+                                    usecols=[0, 4])
+        codelist_df = codelist_df.dropna(subset=[codelist_df.columns[1]])
+        codelists[codelist_id] = dict(zip(codelist_df.iloc[:, 1],
+                                          codelist_df.iloc[:, 0]))
+    return DSDIndex(concepts, codelists)
+
+
+def load_dsd_index(dsd_path, cache_dir) -> DSDIndex:
+    """Gets the DSDIndex of a DSD workbook, from the cache if this version
+        of the workbook (by the hash of its contents) has been parsed
+        before, otherwise by parsing it and caching the result.
+
+    Args:
+        dsd_path (str): path of the DSD workbook
+        cache_dir (str): folder in which parsed DSDs are kept
+
+    Returns:
+        DSDIndex: the parsed concepts and codelists
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, f"{file_hash(dsd_path)}"
+                                         f".v{INDEX_VERSION}.pkl")
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as index_file:
+            return pickle.load(index_file)
+
+    dsd_index = parse_dsd(dsd_path)
+    temp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as index_file:
+        pickle.dump(dsd_index, index_file)
+    os.replace(temp_path, index_path)
+    return dsd_index
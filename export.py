@@ -0,0 +1,221 @@
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# The columns of every SDMX-CSV file, before the dimensions of the
+# indicator, and after them
+LEADING_COLS = ["DATAFLOW", "FREQ", "REPORTING_TYPE", "SERIES", "REF_AREA"]
+TRAILING_COLS = ["TIME_PERIOD", "OBS_VALUE"]
+# The columns of the SDG data that become TIME_PERIOD and OBS_VALUE
+SDG_TIME_COL = "Year"
+SDG_VALUE_COL = "Value"
+
+# What exporting one indicator made: its id, the SDMX-CSV file written
+# (None if it failed), its columns, the rows read and written, the rows
+# dropped because a value had no code or a column had no concept, the
+# columns without a concept and the error that stopped it, if any
+ExportResult = namedtuple("ExportResult",
+                          ["indicator", "path", "columns", "rows_in",
+                           "rows_out", "dropped_unmapped_values",
+                           "dropped_unmapped_columns", "unmapped_columns",
+                           "error"])
+
+# Set in each worker process by _init_worker, so the mappings are only
+# sent to each process once
+_worker = {}
+
+
+def data_url(export_config: dict, indicator_id) -> str:
+    "Gets the URL of the data csv of an indicator"
+    return (export_config['data_url_prefix'] + indicator_id
+            + export_config['data_url_suffix'])
+
+
+def indicator_path(out_dir, indicator_id) -> str:
+    "Gets the path of the SDMX-CSV file of an indicator"
+    return os.path.join(out_dir, f"{indicator_id}.csv")
+
+
+def code_maps(code_mapping_df: pd.DataFrame) -> dict:
+    """Gets the code mapping as a dictionary of SDG value --> SDMX code for
+        each dimension (concept ID), the first code of each value being
+        used"""
+    mapping_df = (code_mapping_df
+                  .dropna(subset=["Dimension"])
+                  .drop_duplicates(subset=["Dimension", "Text"]))
+    return {dimension: dict(zip(group.Text.astype(str), group.Value))
+            for dimension, group in mapping_df.groupby("Dimension")}
+
+
+def _init_worker(config, column_map, dimension_codes, export_config):
+    from fetching import HTTPCache
+
+    _worker["http_cache"] = HTTPCache.from_config(config)
+    _worker["column_map"] = column_map
+    _worker["dimension_codes"] = dimension_codes
+    _worker["export_config"] = export_config
+
+
+def to_sdmx(data_df: pd.DataFrame, indicator_id, column_map: dict,
+            dimension_codes: dict, export_config: dict):
+    """Transforms the data of one indicator into SDMX-CSV. The
+        disaggregation columns are renamed to their SDMX concepts and
+        their values translated to SDMX codes, a whole column at a time.
+
+        Rows with a value in a column that has no SDMX concept, or a value
+        that has no SDMX code, cannot be put in SDMX so are dropped.
+        Columns listed in ignore_columns in the export config are left
+        out. A blank disaggregation value is the total (total_code).
+
+    Args:
+        data_df (pd.DataFrame): the indicator's data, as in its csv
+        indicator_id (str): the id of the indicator, e.g. 1-2-1
+        column_map (dict): SDG disaggregation name --> SDMX concept ID
+        dimension_codes (dict): for each concept ID, SDG value --> code
+        export_config (dict): the export section of the config
+
+    Returns:
+        (pd.DataFrame, dict): i) the SDMX-CSV rows
+                              ii) the number of rows dropped for unmapped
+                                  values and unmapped columns, and the
+                                  unmapped columns
+    """
+    ignored = set(export_config['ignore_columns'])
+    disag_cols = [col for col in data_df.columns
+                  if col not in (SDG_TIME_COL, SDG_VALUE_COL)
+                  and col not in ignored]
+    mapped_cols = [col for col in disag_cols if col in column_map]
+    unmapped_cols = [col for col in disag_cols if col not in column_map]
+
+    # Rows disaggregated by a column with no SDMX concept are dropped;
+    # the rows where it is blank are kept
+    keep = data_df[unmapped_cols].isna().all(axis=1).to_numpy()
+    dropped_columns = int((~keep).sum())
+    data_df = data_df[keep]
+
+    total_code = export_config['total_code']
+    dimensions = {}
+    has_code = pd.Series(True, index=data_df.index)
+    for col in mapped_cols:
+        concept = column_map[col]
+        values = data_df[col]
+        codes = (values.astype(str)
+                 .map(dimension_codes.get(concept, {}))
+                 .where(values.notna(), total_code))
+        has_code &= codes.notna()
+        dimensions[concept] = codes
+    dropped_values = int((~has_code).sum())
+
+    sdmx_df = pd.DataFrame(dimensions, index=data_df.index)[has_code]
+    series = (export_config.get('series') or {}).get(indicator_id)
+    leading = {"DATAFLOW": export_config['dataflow'],
+               "FREQ": export_config['freq'],
+               "REPORTING_TYPE": export_config['reporting_type'],
+               "SERIES": series,
+               "REF_AREA": export_config['ref_area']}
+    sdmx_df = sdmx_df.assign(
+        **leading,
+        TIME_PERIOD=data_df.loc[has_code, SDG_TIME_COL],
+        OBS_VALUE=data_df.loc[has_code, SDG_VALUE_COL])
+    sdmx_df = sdmx_df[[*LEADING_COLS, *sorted(dimensions), *TRAILING_COLS]]
+    return sdmx_df, {"dropped_unmapped_values": dropped_values,
+                     "dropped_unmapped_columns": dropped_columns,
+                     "unmapped_columns": unmapped_cols}
+
+
+def export_indicator(indicator_id, url, out_path) -> ExportResult:
+    """Fetches the data of one indicator, transforms it into SDMX-CSV and
+        writes it to its own file, in a worker process. Only a summary is
+        sent back, so the data of all the indicators are never held in
+        memory at once."""
+    try:
+        # Read as text, so values are matched and written as they are
+        data_df = pd.read_csv(_worker["http_cache"].fetch(url), dtype=str)
+        sdmx_df, dropped = to_sdmx(data_df, indicator_id,
+                                   _worker["column_map"],
+                                   _worker["dimension_codes"],
+                                   _worker["export_config"])
+        sdmx_df.to_csv(out_path, index=False)
+    except Exception as ex:
+        return ExportResult(indicator_id, None, [], 0, 0, 0, 0, [],
+                            repr(ex))
+    return ExportResult(indicator_id, out_path, list(sdmx_df.columns),
+                        len(data_df), len(sdmx_df), error=None, **dropped)
+
+
+def combine(results: list, out_path, total_code, chunk_rows=100000):
+    """Streams the SDMX-CSV files of the indicators into one file, a chunk
+        at a time. The file has every dimension of any indicator; an
+        indicator without a dimension has total_code in it.
+
+    Args:
+        results (list): the ExportResult of each indicator
+        out_path (str): the combined SDMX-CSV file
+        total_code (str): the code for a dimension that is not broken down
+        chunk_rows (int): how many rows are read at a time
+
+    Returns:
+        int: the rows written
+    """
+    written = [result for result in results if result.path]
+    dimensions = sorted({col for result in written
+                         for col in result.columns
+                         if col not in LEADING_COLS + TRAILING_COLS})
+    columns = [*LEADING_COLS, *dimensions, *TRAILING_COLS]
+    rows = 0
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as out_file:
+        pd.DataFrame(columns=columns).to_csv(out_file, index=False)
+        for result in written:
+            for chunk in pd.read_csv(result.path, dtype=str,
+                                     keep_default_na=False,
+                                     chunksize=chunk_rows):
+                chunk = chunk.reindex(columns=columns)
+                chunk[dimensions] = chunk[dimensions].fillna(total_code)
+                chunk.to_csv(out_file, index=False, header=False)
+                rows += len(chunk)
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+def export_indicators(config: dict, indicator_ids: list,
+                      column_mapping_df: pd.DataFrame,
+                      code_mapping_df: pd.DataFrame, out_dir,
+                      max_workers=None) -> list:
+    """Exports the data of each indicator to SDMX-CSV in a pool of
+        processes, one indicator at a time in each process.
+
+    Args:
+        config (dict): the config of the run
+        indicator_ids (list): the indicators to export
+        column_mapping_df (pd.DataFrame): the concept mapping (Text is
+            the SDG disaggregation name, Value the SDMX concept ID)
+        code_mapping_df (pd.DataFrame): the code mapping
+        out_dir (str): the folder the SDMX-CSV file of each indicator is
+            written to
+        max_workers (int): the most indicators exported at one time. None
+            means one per CPU.
+
+    Returns:
+        list: the ExportResult of each indicator, in order
+    """
+    export_config = config['export']
+    os.makedirs(out_dir, exist_ok=True)
+    column_map = dict(zip(column_mapping_df.Text, column_mapping_df.Value))
+    urls = [data_url(export_config, indicator_id)
+            for indicator_id in indicator_ids]
+    out_paths = [indicator_path(out_dir, indicator_id)
+                 for indicator_id in indicator_ids]
+    # The stage may run in a thread alongside others, so the workers are
+    # spawned rather than forked while other threads may hold locks
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker,
+                             initargs=(config, column_map,
+                                       code_maps(code_mapping_df),
+                                       export_config)) as executor:
+        return list(executor.map(export_indicator, indicator_ids, urls,
+                                 out_paths))
@@ -0,0 +1,340 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pipeline import current_stage
+
+
+class CacheMissError(Exception):
+    """Raised when a URL is requested in offline mode but has never
+        been downloaded into the cache."""
+
+
+# How one request for a URL was served: from the network, from the cache
+# after a 304 Not Modified, from the cache without contacting the server,
+# from the cache because the server could not be reached, or by an earlier
+# request for the same URL in this run. seconds is how long it took and
+# bytes how much was downloaded. stage is the stage that made the request,
+# if any.
+FetchStat = namedtuple("FetchStat",
+                       ["url", "source", "seconds", "bytes", "stage"],
+                       defaults=(None,))
+
+
+class HTTPCache:
+    """An on-disk cache for the remote files the script reads, such as
+        the meta data (all.json), the disaggregation report, the DSD
+        workbook and the disaggregation value csvs.
+
+        Each response is stored under a file name made from a hash of
+        its URL, next to a small json file holding the ETag and
+        Last-Modified headers. While an entry is younger than `max_age`
+        it is used without contacting the server; after that it is
+        revalidated with a conditional request, so an unchanged file
+        is never downloaded twice.
+
+        All requests go through one requests.Session, so connections to
+        a server are kept open and reused. Each URL is only requested
+        once per HTTPCache (i.e. per run): later requests for it, and
+        requests made while it is still downloading, get the same file.
+        How every request was served is recorded in `stats`.
+
+    Args:
+        cache_dir (str): folder in which cached responses are kept
+        max_age (float): seconds for which a cached response is used
+            without revalidation
+        max_size (int): the total size in bytes the cache may grow to
+            before the least recently used entries are evicted.
+            None means no limit.
+        max_entry_age (float): seconds after which an entry that has
+            not been used is evicted. None means no limit.
+        offline (bool): if True the network is never used; only cached
+            responses are returned
+        timeout (float): seconds to wait for the server to respond
+        pool_size (int): how many connections to each server are kept
+            open, which should be at least the number of threads that
+            fetch at once
+    """
+
+    def __init__(self, cache_dir, max_age=86400, max_size=None,
+                 max_entry_age=None, offline=False, timeout=60,
+                 pool_size=10):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_size = max_size
+        self.max_entry_age = max_entry_age
+        self.offline = offline
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = []
+        # The body path of each URL already fetched in this run, and a
+        # lock for each URL so it is only fetched by one thread at a time
+        self._fetched = {}
+        self._url_locks = {}
+        self._url_locks_lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Builds the cache from the http_cache section of the config.
+            Sizes are given in MB and ages in hours/days in the config."""
+        cache_config = config.get('http_cache') or {}
+        fetch_config = config.get('fetch') or {}
+        max_size_mb = cache_config.get('max_size_mb')
+        max_entry_age_days = cache_config.get('max_entry_age_days')
+        return cls(
+            cache_dir=cache_config.get('cache_dir', '.http_cache'),
+            max_age=cache_config.get('max_age_hours', 24) * 3600,
+            max_size=(max_size_mb * 1024 * 1024
+                      if max_size_mb is not None else None),
+            max_entry_age=(max_entry_age_days * 86400
+                           if max_entry_age_days is not None else None),
+            offline=cache_config.get('offline', False),
+            pool_size=max(10, fetch_config.get('max_workers', 0)))
+
+    def _paths(self, url):
+        """Gets the body and meta data file paths for a URL. The file
+            extension of the URL is kept so the body can be opened by
+            readers that look at the extension."""
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        extension = os.path.splitext(urlparse(url).path)[1]
+        body_path = os.path.join(self.cache_dir, key + extension)
+        meta_path = os.path.join(self.cache_dir, key + ".meta.json")
+        return body_path, meta_path
+
+    @staticmethod
+    def _read_meta(meta_path):
+        try:
+            with open(meta_path) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _tmp_path(path):
+        """Gets a temporary file path that is unique to the thread, so
+            concurrent downloads of the same URL do not clash"""
+        return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+    @classmethod
+    def _write_meta(cls, meta_path, meta):
+        tmp_path = cls._tmp_path(meta_path)
+        with open(tmp_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, meta_path)
+
+    def fetch(self, url: str) -> str:
+        """Gets a local file path holding the body of the URL,
+            downloading or revalidating it only when needed.
+
+        Args:
+            url (str): the URL of the remote file
+
+        Raises:
+            CacheMissError: in offline mode, if the URL is not cached
+
+        Returns:
+            str: path to the cached copy of the remote file
+        """
+        with self._url_locks_lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+        with url_lock:
+            start = time.perf_counter()
+            if url in self._fetched and os.path.exists(self._fetched[url]):
+                body_path, source, n_bytes = self._fetched[url], "run", 0
+            else:
+                body_path, source, n_bytes = self._fetch(url)
+                self._fetched[url] = body_path
+            self.stats.append(FetchStat(url, source,
+                                        time.perf_counter() - start,
+                                        n_bytes, current_stage.get()))
+        return body_path
+
+    def _fetch(self, url):
+        """Gets the body of the URL from the cache or the network.
+
+        Returns:
+            (str, str, int): the body path, how it was served (see
+                FetchStat) and the number of bytes downloaded
+        """
+        body_path, meta_path = self._paths(url)
+        meta = self._read_meta(meta_path)
+        cached = meta is not None and os.path.exists(body_path)
+
+        if self.offline:
+            if not cached:
+                raise CacheMissError(f"{url} is not in the cache and "
+                                     "offline mode is switched on")
+            return self._hit(meta_path, meta, body_path), "cache", 0
+
+        if cached and time.time() - meta["fetched_at"] < self.max_age:
+            return self._hit(meta_path, meta, body_path), "cache", 0
+
+        headers = {}
+        if cached:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, stream=True,
+                                        timeout=self.timeout)
+            if cached and response.status_code == 304:
+                response.close()
+                meta["fetched_at"] = time.time()
+                return (self._hit(meta_path, meta, body_path),
+                        "revalidated", 0)
+            response.raise_for_status()
+        except requests.RequestException as ex:
+            if not cached:
+                raise
+            print(f"Could not revalidate {url}, using cached copy. {ex}")
+            return self._hit(meta_path, meta, body_path), "stale", 0
+
+        n_bytes = self._store(url, response, body_path, meta_path)
+        self.evict(keep=body_path)
+        return body_path, "network", n_bytes
+
+    def _hit(self, meta_path, meta, body_path):
+        """Records that a cached entry has been used and returns it"""
+        meta["last_used"] = time.time()
+        self._write_meta(meta_path, meta)
+        return body_path
+
+    def _store(self, url, response, body_path, meta_path):
+        """Streams a response body to disk and records its validators.
+            Returns the size of the body."""
+        tmp_path = self._tmp_path(body_path)
+        with response, open(tmp_path, "wb") as body_file:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                body_file.write(chunk)
+        os.replace(tmp_path, body_path)
+        now = time.time()
+        self._write_meta(meta_path, {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": os.path.getsize(body_path),
+            "fetched_at": now,
+            "last_used": now})
+        return os.path.getsize(body_path)
+
+    def summary(self) -> dict:
+        """Sums up the requests made so far: how many were served from
+            each source, and the bytes and seconds spent on them"""
+        summary = {}
+        for stat in self.stats:
+            totals = summary.setdefault(stat.source, {"requests": 0,
+                                                      "bytes": 0,
+                                                      "seconds": 0.0})
+            totals["requests"] += 1
+            totals["bytes"] += stat.bytes
+            totals["seconds"] += stat.seconds
+        return summary
+
+    def evict(self, keep=None):
+        """Removes entries that have not been used for longer than
+            max_entry_age, then removes the least recently used entries
+            until the cache is no bigger than max_size.
+
+        Args:
+            keep (str): body path of an entry that must not be evicted,
+                such as the one that has just been downloaded
+        """
+        with self._evict_lock:
+            self._evict(keep)
+
+    def _evict(self, keep):
+        entries = []
+        for file_name in os.listdir(self.cache_dir):
+            if not file_name.endswith(".meta.json"):
+                continue
+            meta_path = os.path.join(self.cache_dir, file_name)
+            meta = self._read_meta(meta_path)
+            if meta is None:
+                continue
+            body_path, _ = self._paths(meta["url"])
+            entries.append((meta["last_used"], meta["size"],
+                            body_path, meta_path))
+
+        now = time.time()
+        entries.sort()
+        total_size = sum(entry[1] for entry in entries)
+        for last_used, size, body_path, meta_path in entries:
+            too_old = (self.max_entry_age is not None
+                       and now - last_used > self.max_entry_age)
+            too_big = self.max_size is not None and total_size > self.max_size
+            if body_path == keep or not (too_old or too_big):
+                continue
+            for path in (body_path, meta_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total_size -= size
+
+
+FetchResult = namedtuple("FetchResult", ["url", "value", "error"])
+
+
+def _is_retryable(ex):
+    """Decides if a failed request is worth trying again. Connection
+        problems, timeouts and server errors are; client errors such as
+        404 Not Found are not."""
+    if isinstance(ex, requests.HTTPError) and ex.response is not None:
+        status = ex.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(ex, (requests.ConnectionError, requests.Timeout))
+
+
+def _fetch_with_retries(url, fetch_func, retries, backoff):
+    """Calls fetch_func on the url, retrying with exponential backoff.
+        Any error that is still raised after the last try is returned in
+        the FetchResult rather than raised."""
+    for attempt in range(retries + 1):
+        try:
+            return FetchResult(url, fetch_func(url), None)
+        except Exception as ex:
+            if attempt == retries or not _is_retryable(ex):
+                return FetchResult(url, None, ex)
+            time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_many(urls, fetch_func, max_workers=8, retries=3, backoff=0.5):
+    """Fetches many URLs at once with a bounded pool of threads.
+
+    Args:
+        urls (iterable): the URLs to be fetched
+        fetch_func (callable): takes a URL and returns its parsed
+            content, e.g. a function reading a cached csv into a df
+        max_workers (int): the most URLs that are fetched at one time
+        retries (int): how many times a failed URL is tried again
+        backoff (float): seconds to wait before the first retry, which
+            doubles for every retry after that
+
+    Returns:
+        list: a FetchResult(url, value, error) for each URL, in the same
+            order as urls. error is None if the URL was fetched.
+    """
+    urls = list(urls)
+    # Each URL is fetched in a copy of the caller's context, so its
+    # request is put down to the stage that asked for it
+    contexts = [contextvars.copy_context() for _ in urls]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            lambda context, url: context.run(_fetch_with_retries, url,
+                                             fetch_func, retries, backoff),
+            contexts, urls))
@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process, utils
+
+SUGGESTION_COLS = ["column_name", "column_value", "rank",
+                   "sdmx_name", "sdmx_code", "score"]
+# The blocking used when the config does not give one: codelists of at
+# least min_names names are blocked on ngram characters and only the
+# shortlist names sharing most of them with a value are scored
+DEFAULT_BLOCKING = {"min_names": 500, "shortlist": 50, "ngram": 3}
+RECALL_COLS = ["column_name", "decisions", "in_shortlist", "recall"]
+
+
+def _sort_tokens(text: str) -> str:
+    """Lower cases the text, removes punctuation and sorts its words, as
+        the token sort scorers do before comparing"""
+    return " ".join(sorted(utils.default_process(text).split()))
+
+
+def _ngrams(text: str, n: int) -> set:
+    """Gets the distinct character ngrams of a prepared text, padded with
+        a space at each end so the first and last letters of a word count
+        as much as the others"""
+    padded = f" {text} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class NgramIndex:
+    """An inverted index of the character ngrams of the prepared names of
+        a codelist (lower case, without punctuation, words sorted), so the
+        names most like a value can be found by counting shared ngrams
+        without comparing the value with every name.
+
+    Args:
+        prepared_names (list): the prepared names of the codelist
+        n (int): the length of the ngrams
+    """
+
+    def __init__(self, prepared_names: list, n=3):
+        self.n = n
+        self.size = len(prepared_names)
+        postings = {}
+        for position, name in enumerate(prepared_names):
+            for ngram in _ngrams(name, n):
+                postings.setdefault(ngram, []).append(position)
+        self._postings = {ngram: np.array(positions, dtype=np.int32)
+                          for ngram, positions in postings.items()}
+        self._ngram_counts = np.array([len(_ngrams(name, n))
+                                       for name in prepared_names],
+                                      dtype=np.int64)
+
+    def shortlist(self, prepared_value: str, size: int) -> np.ndarray:
+        """Gets the positions of the size names sharing the most ngrams
+            with the value, in codelist order.
+
+        Args:
+            prepared_value (str): the value, prepared as the names are
+            size (int): how many names to get
+
+        Returns:
+            np.ndarray: the positions of the names
+        """
+        if size >= self.size:
+            return np.arange(self.size)
+        value_ngrams = _ngrams(prepared_value, self.n)
+        lists = [self._postings[ngram] for ngram in value_ngrams
+                 if ngram in self._postings]
+        if lists:
+            shared = np.bincount(np.concatenate(lists), minlength=self.size)
+        else:
+            shared = np.zeros(self.size, dtype=np.int64)
+        # partial_ratio looks for the shorter text in the longer one, so
+        # names are ranked by the share of the shorter one's ngrams found
+        # in the other
+        containment = shared / np.minimum(self._ngram_counts,
+                                          len(value_ngrams))
+        return np.sort(np.argpartition(-containment, size - 1)[:size])
+
+
+class Codelist:
+    """The names and codes of one DSD codelist, with the names already
+        prepared for fuzzy matching, so this is only done once for each
+        codelist rather than once for every value matched against it.
+
+        Large codelists (e.g. areas or occupations) get an NgramIndex, and
+        each value is only scored against the shortlist of names that
+        share the most ngrams with it, so matching a value takes about as
+        long however many names the codelist has.
+
+    Args:
+        code_name_dict (dict): SDMX names (English) --> SDMX codes
+        blocking (dict): min_names, shortlist and ngram, as in the
+            fuzzy_match: blocking section of the config. None uses
+            DEFAULT_BLOCKING.
+    """
+
+    def __init__(self, code_name_dict: dict, blocking=None):
+        names = [name for name in code_name_dict if isinstance(name, str)]
+        self.names = np.array(names, dtype=object)
+        self.codes = np.array([code_name_dict[name] for name in names],
+                              dtype=object)
+        self.prepared_names = [_sort_tokens(name) for name in names]
+        blocking = {**DEFAULT_BLOCKING, **(blocking or {})}
+        self.shortlist_size = blocking["shortlist"]
+        self.index = None
+        if (len(names) >= blocking["min_names"]
+                and len(names) > self.shortlist_size):
+            self.index = NgramIndex(self.prepared_names, blocking["ngram"])
+
+    def shortlist(self, value) -> np.ndarray:
+        """Gets the positions of the names a value is scored against: the
+            shortlist from the index, or every name if there is no index"""
+        if self.index is None:
+            return np.arange(len(self.names))
+        return self.index.shortlist(_sort_tokens(str(value)),
+                                    self.shortlist_size)
+
+    def top_matches(self, values: list, limit: int):
+        """Scores every value against every name in the codelist at once
+            with the partial token sort ratio, and gets the best matches.
+
+        Args:
+            values (list): the SDG values to be matched
+            limit (int): how many of the best matches to get per value
+
+        Returns:
+            (np.ndarray, np.ndarray): i) the positions of the best names
+                                         for each value, best first
+                                      ii) their scores
+        """
+        prepared_values = [_sort_tokens(str(value)) for value in values]
+        limit = min(limit, len(self.prepared_names))
+        if self.index is None:
+            scores = process.cdist(prepared_values, self.prepared_names,
+                                   scorer=fuzz.partial_ratio,
+                                   dtype=np.uint8, workers=-1)
+            # Stable sort so that equal scores keep the codelist order
+            best = np.argsort(-scores.astype(np.int16), axis=1,
+                              kind="stable")[:, :limit]
+            return best, np.take_along_axis(scores, best, axis=1)
+
+        size = max(limit, self.shortlist_size)
+        best = np.empty((len(prepared_values), limit), dtype=np.intp)
+        best_scores = np.empty((len(prepared_values), limit), dtype=np.uint8)
+        for row, prepared_value in enumerate(prepared_values):
+            # The shortlist is in codelist order, so the stable sort keeps
+            # equal scores in codelist order as above
+            shortlist = self.index.shortlist(prepared_value, size)
+            scores = process.cdist([prepared_value],
+                                   [self.prepared_names[position]
+                                    for position in shortlist],
+                                   scorer=fuzz.partial_ratio,
+                                   dtype=np.uint8)[0]
+            order = np.argsort(-scores.astype(np.int16),
+                               kind="stable")[:limit]
+            best[row] = shortlist[order]
+            best_scores[row] = scores[order]
+        return best, best_scores
+
+
+def suggest_matches(val_col_pairs_df: pd.DataFrame,
+                    dsd_code_name_list_dict: dict,
+                    limit=8, blocking=None) -> pd.DataFrame:
+    """Finds the best matching SDMX names for every distinct SDG value,
+        one codelist (disaggregation) at a time.
+
+    Args:
+        val_col_pairs_df (pd.DataFrame): the SDG values (column_value)
+            with their SDMX concept names (column_name)
+        dsd_code_name_list_dict (dict): SDMX names --> SDMX codes for each
+            SDMX concept name
+        limit (int): how many of the best matches to get per value
+        blocking (dict): when and how large codelists are blocked, see
+            Codelist
+
+    Returns:
+        pd.DataFrame: the best matches of every value, with their rank
+            (1 is best), SDMX name, SDMX code and score (0-100)
+    """
+    tables = []
+    distinct_values = (val_col_pairs_df
+                       .loc[:, ["column_name", "column_value"]]
+                       .drop_duplicates())
+    for column_name, group in distinct_values.groupby("column_name",
+                                                      sort=False,
+                                                      observed=True):
+        if column_name not in dsd_code_name_list_dict:
+            continue
+        codelist = Codelist(dsd_code_name_list_dict[column_name], blocking)
+        if not len(codelist.names):
+            continue
+        values = group.column_value.to_numpy()
+        best, scores = codelist.top_matches(values, limit)
+        per_value = best.shape[1]
+        tables.append(pd.DataFrame({
+            "column_name": column_name,
+            "column_value": np.repeat(values, per_value),
+            "rank": np.tile(np.arange(1, per_value + 1), len(values)),
+            "sdmx_name": codelist.names[best.ravel()],
+            "sdmx_code": codelist.codes[best.ravel()],
+            "score": scores.ravel()}))
+    if not tables:
+        return pd.DataFrame(columns=SUGGESTION_COLS)
+    return pd.concat(tables, ignore_index=True)
+
+
+def shortlist_recall(decisions_df: pd.DataFrame,
+                     dsd_code_name_list_dict: dict,
+                     blocking=None) -> pd.DataFrame:
+    """Checks how often the code chosen for a value by hand (e.g. in
+        manually_chosen_values_corrected.xlsx) is in the shortlist the
+        value would be scored against. Every codelist with more names than
+        the shortlist is blocked for the check, however small, so the
+        shortlist settings can be tried on the decisions there are.
+        Codelists no bigger than the shortlist are always scored in full,
+        so they are left out rather than counted with a recall of 1.
+
+    Args:
+        decisions_df (pd.DataFrame): column_name, column_value and the
+            chosen sdmx_code of each decision
+        dsd_code_name_list_dict (dict): SDMX names --> SDMX codes for each
+            SDMX concept name
+        blocking (dict): the blocking to check, see Codelist
+
+    Returns:
+        pd.DataFrame: for each blocked codelist with decisions of codes in
+            it, how many there are, how many chosen codes were in the
+            shortlist, and the recall
+    """
+    blocking = {**DEFAULT_BLOCKING, **(blocking or {}), "min_names": 0}
+    rows = []
+    decided = decisions_df.dropna(subset=["column_name", "column_value",
+                                          "sdmx_code"])
+    for column_name, group in decided.groupby("column_name", sort=False):
+        if column_name not in dsd_code_name_list_dict:
+            continue
+        codelist = Codelist(dsd_code_name_list_dict[column_name], blocking)
+        if codelist.index is None:
+            continue
+        codes = codelist.codes.astype(str)
+        # Codes that are not in the codelist could never be suggested
+        group = group[group.sdmx_code.astype(str).isin(codes)]
+        if not len(group):
+            continue
+        found = sum(str(code) in codes[codelist.shortlist(value)]
+                    for value, code in zip(group.column_value,
+                                           group.sdmx_code))
+        rows.append((column_name, len(group), found, found / len(group)))
+    return pd.DataFrame(rows, columns=RECALL_COLS)
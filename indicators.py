@@ -0,0 +1,111 @@
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Indicator ids are goal-target-indicator, e.g. 1-2-1 or 17-a-1, and may
+# be marked as archived
+ID_PATTERN = r"(\d+)-([0-9A-Za-z]+)-(\d+)"
+# Ids containing this (in any case) are archived indicators
+ARCHIVED_MARK = "archived"
+# Numeric targets come before alphabetic ones, which are ranked from here
+ALPHA_TARGET_RANK = 1000
+# The key is goal * GOAL_SCALE + target rank * TARGET_SCALE + indicator,
+# doubled with 1 added for archived indicators
+GOAL_SCALE = 10 ** 8
+TARGET_SCALE = 10 ** 4
+
+
+def is_archived(indicator_id) -> bool:
+    "Checks if an indicator id is that of an archived indicator"
+    return ARCHIVED_MARK in str(indicator_id).lower()
+
+
+class IndicatorIds:
+    """Indicator ids such as '1-2-1' or '17-a-1', parsed once into their
+        goal, target and indicator numbers and an integer key.
+
+        Sorting the keys sorts the indicators naturally: goal numerically,
+        then target numerically then alphabetically, then indicator
+        numerically, so 1-10-1 comes after 1-9-1 and 1-a-1 after 1-10-1.
+        Archived indicators have their own keys, so they are never
+        mistaken for the current indicator with the same number. Joins,
+        sorts and exclusions done on the keys are integer operations
+        rather than string matching.
+
+        Ids that are not goal-target-indicator are given a negative key
+        from a hash of the id, so they still match themselves, and sort
+        before the others.
+
+    Args:
+        ids (iterable): the indicator ids, e.g. the index of the meta data.
+            A leading '#', as in the disaggregation report, is ignored.
+    """
+
+    def __init__(self, ids):
+        ids = pd.Series(np.asarray(ids, dtype=object), dtype="string")
+        self.ids = ids.to_numpy(dtype=object)
+        ids = ids.str.lstrip("#")
+        parts = ids.str.extract(ID_PATTERN)
+        parsed = parts.notna().all(axis=1).to_numpy()
+        self.archived = (ids.str.contains(ARCHIVED_MARK, case=False)
+                         .to_numpy(dtype=bool, na_value=False))
+
+        self.goal = np.zeros(len(ids), dtype=np.int64)
+        self.target = np.zeros(len(ids), dtype=np.int64)
+        self.indicator = np.zeros(len(ids), dtype=np.int64)
+        self.goal[parsed] = parts[0][parsed].astype(np.int64)
+        self.indicator[parsed] = parts[2][parsed].astype(np.int64)
+        targets = parts[1][parsed]
+        numeric = targets.str.isdigit().to_numpy(dtype=bool)
+        target_rank = np.zeros(len(targets), dtype=np.int64)
+        target_rank[numeric] = targets[numeric].astype(np.int64)
+        target_rank[~numeric] = ALPHA_TARGET_RANK + np.array(
+            [int(target, 36) for target in targets[~numeric].str.lower()],
+            dtype=np.int64)
+        self.target[parsed] = target_rank
+
+        keys = (self.goal * GOAL_SCALE + self.target * TARGET_SCALE
+                + self.indicator) * 2 + self.archived
+        unparsed = ~parsed
+        keys[unparsed] = [-1 - zlib.crc32(str(id_).encode("utf-8"))
+                          for id_ in self.ids[unparsed]]
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def take(self, rows) -> "IndicatorIds":
+        """Gets some of the ids, by position or boolean mask, without
+            parsing them again, e.g. after rows of a dataframe are
+            filtered"""
+        taken = object.__new__(IndicatorIds)
+        for name in ("ids", "archived", "goal", "target", "indicator",
+                     "keys"):
+            setattr(taken, name, getattr(self, name)[rows])
+        return taken
+
+    def sort_order(self, sort_order=("goal", "target", "indicator")):
+        """Gets the positions of the ids in sorted order.
+
+        Args:
+            sort_order (list): which of goal, target and indicator to sort
+                by, most important first, as in the config
+
+        Returns:
+            np.ndarray: the positions, for use with iloc
+        """
+        # lexsort sorts by the last array first. The archived flag and the
+        # keys break ties, so the order is always the same.
+        return np.lexsort([self.keys, self.archived,
+                           *[getattr(self, part)
+                             for part in reversed(list(sort_order))]])
+
+    def isin(self, ids) -> np.ndarray:
+        """Checks if each id is one of the given ids, e.g. the
+            2020indicators from the config
+
+        Returns:
+            np.ndarray: boolean array, True for the ids that are in ids
+        """
+        return np.isin(self.keys, IndicatorIds(ids).keys)
@@ -0,0 +1,166 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _rows(values: dict) -> dict:
+    "Gets the number of rows of every dataframe (or series) in values"
+    return {name: len(value) for name, value in values.items()
+            if isinstance(value, (pd.DataFrame, pd.Series))}
+
+
+def _max_rss_mb():
+    """Gets the peak memory used by the process so far, in MB, or None if
+        it cannot be measured on this platform"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB elsewhere
+    return max_rss / 1024 ** (2 if os.uname().sysname == "Darwin" else 1)
+
+
+class StageRecorder:
+    """Records how long each stage of a run takes, the memory it uses, what
+        it downloads and the rows of the dataframes it is given and makes,
+        and writes these to a json run report.
+
+        The downloads of a stage are those it makes while it runs, and
+        those of its sources, made while checking if its inputs have
+        changed.
+
+        The peak resident memory of the process is recorded when each
+        stage starts and finishes. It only ever goes up, so the increase
+        is how much the stage raised the peak, not how much it used; when
+        stages run at the same time it includes the others. With
+        trace_memory on, tracemalloc also records the peak memory
+        allocated within each stage, which is more exact but slows the run
+        down, and the stages are run one at a time so their peaks are kept
+        apart. With profile on, each stage is run under cProfile and its
+        profile is written next to the report.
+
+    Args:
+        report_path (str): the json file the report is written to
+        trace_memory (bool): if True, trace the memory allocated by each
+            stage with tracemalloc
+        profile (bool): if True, profile each stage with cProfile
+    """
+
+    def __init__(self, report_path, trace_memory=False, profile=False):
+        self.report_path = report_path
+        self.trace_memory = trace_memory
+        self.profile = profile
+        self.stages = []
+        self.schedule = None
+        self.started = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+
+    @classmethod
+    def from_config(cls, config: dict, report_dir="outputs"):
+        """Builds the recorder from the instrumentation section of the
+            config, or returns None if it is switched off"""
+        instrumentation = config.get('instrumentation') or {}
+        if not instrumentation.get('enabled', False):
+            return None
+        return cls(os.path.join(report_dir,
+                                instrumentation.get('report_file',
+                                                    'run_report.json')),
+                   trace_memory=instrumentation.get('trace_memory', False),
+                   profile=instrumentation.get('profile', False))
+
+    def skipped(self, stage_name, outputs: dict):
+        "Records a stage whose stored outputs were used"
+        self.stages.append({"stage": stage_name,
+                            "status": "skipped",
+                            "rows_out": _rows(outputs)})
+
+    @contextmanager
+    def measure(self, ctx, stage_name, inputs: dict):
+        """Measures a stage while it runs in the context. The stage's
+            outputs should be put in the dictionary the context gives, so
+            their rows can be counted.
+
+        Args:
+            ctx (RunContext): the context of the run, for its downloads
+            stage_name (str): the name of the stage
+            inputs (dict): the inputs the stage is given
+        """
+        outputs = {}
+        rss_start = _max_rss_mb()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if self.profile else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield outputs
+        finally:
+            if profiler:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            fetches = [stat for stat in ctx.fetch_stats
+                       if stat.stage == stage_name]
+            rss_end = _max_rss_mb()
+            record = {"stage": stage_name,
+                      "status": "ran",
+                      "seconds": round(seconds, 4),
+                      "peak_rss_start_mb": rss_start,
+                      "peak_rss_end_mb": rss_end,
+                      "peak_rss_increase_mb": (None if rss_end is None
+                                               else rss_end - rss_start),
+                      "network_requests": sum(stat.source == "network"
+                                              for stat in fetches),
+                      "network_bytes": sum(stat.bytes for stat in fetches),
+                      "rows_in": _rows(inputs),
+                      "rows_out": _rows(outputs)}
+            if self.trace_memory:
+                record["peak_traced_mb"] = (tracemalloc.get_traced_memory()[1]
+                                            / 1024 ** 2)
+            if profiler:
+                profile_path = (os.path.splitext(self.report_path)[0]
+                                + f"-{stage_name}.prof")
+                profiler.dump_stats(profile_path)
+                record["profile"] = profile_path
+            self.stages.append(record)
+
+    def report(self, fetch_summary=None) -> dict:
+        """Gets the run report.
+
+        Args:
+            fetch_summary (dict): the totals of the remote file requests
+                of the run, from HTTPCache.summary
+        """
+        return {"started": self.started.isoformat(),
+                "total_seconds": round(time.perf_counter() - self._start, 4),
+                "max_rss_mb": _max_rss_mb(),
+                "fetches": fetch_summary or {},
+                "stages": self.stages,
+                "schedule": self.schedule}
+
+    def write(self, fetch_summary=None):
+        "Writes the run report to its json file"
+        with open(self.report_path, "w") as report_file:
+            json.dump(self.report(fetch_summary), report_file, indent=2)
+
+    def print_summary(self):
+        "Prints a line for each stage of the run"
+        for record in self.stages:
+            if record["status"] == "skipped":
+                print(f"{record['stage']:<18} skipped")
+                continue
+            print(f"{record['stage']:<18} {record['seconds']:8.3f}s "
+                  f"{record['network_bytes'] / 1024:8.0f} KB downloaded, "
+                  f"rows out {record['rows_out']}")
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+
+# What to do with keys that are not in the index: give NaN, keep the key
+# itself, raise a KeyError, or (v_lookup only) drop the row
+MISSING_POLICIES = ("nan", "keep", "raise", "drop")
+# What to do if a key is in the index more than once: use the first or
+# last value, or raise a ValueError
+DUPLICATE_POLICIES = ("first", "last", "raise")
+
+
+class LookupIndex:
+    """A hash index of keys --> values, like the table of an Excel
+        VLookup, which looks up a whole column of keys at once.
+
+    Args:
+        keys (iterable): the keys, e.g. SDG column names
+        values (iterable): the value of each key, e.g. SDMX concept names
+        duplicates (str): one of DUPLICATE_POLICIES
+
+    Raises:
+        ValueError: if duplicates is "raise" and a key is repeated
+    """
+
+    def __init__(self, keys, values, duplicates="first"):
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicates policy '{duplicates}'. "
+                             f"Use one of {DUPLICATE_POLICIES}")
+        table = pd.DataFrame({"key": keys, "value": values})
+        repeated = table.key.duplicated(keep=False)
+        if duplicates == "raise" and repeated.any():
+            raise ValueError("These keys have more than one value: "
+                             f"{list(table.key[repeated].unique())}")
+        table = table.drop_duplicates(subset="key", keep=duplicates)
+        self._keys = pd.Index(table.key)
+        self._values = table.value.to_numpy()
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame, key_col, value_col,
+                duplicates="first"):
+        "Builds the index from two columns of a dataframe"
+        return cls(df[key_col], df[value_col], duplicates)
+
+    @classmethod
+    def from_dict(cls, mapping: dict):
+        "Builds the index from a dictionary of keys --> values"
+        return cls(list(mapping.keys()), list(mapping.values()))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def contains(self, keys: pd.Series) -> np.ndarray:
+        "Checks if each key in the series is in the index"
+        return self._keys.get_indexer(keys) != -1
+
+    def lookup(self, keys: pd.Series, missing="nan") -> pd.Series:
+        """Looks up every key in the series.
+
+        Args:
+            keys (pd.Series): the keys to look up
+            missing (str): "nan", "keep" or "raise" (see MISSING_POLICIES)
+
+        Raises:
+            KeyError: if missing is "raise" and a key is not in the index
+
+        Returns:
+            pd.Series: the value of each key, with the index of keys
+        """
+        if missing not in MISSING_POLICIES[:3]:
+            raise ValueError(f"Unknown missing policy '{missing}'. "
+                             f"Use one of {MISSING_POLICIES[:3]}")
+        positions = self._keys.get_indexer(keys)
+        not_found = positions == -1
+        if missing == "raise" and not_found.any():
+            raise KeyError("These keys were not found: "
+                           f"{list(pd.unique(keys[not_found]))}")
+        values = np.full(len(positions), np.nan, dtype=object)
+        values[~not_found] = self._values[positions[~not_found]]
+        if missing == "keep":
+            values[not_found] = np.asarray(keys, dtype=object)[not_found]
+        return pd.Series(values, index=keys.index, name=keys.name)
+
+
+def v_lookup(df: pd.DataFrame, column, index: LookupIndex,
+             new_column=None, missing="nan") -> pd.DataFrame:
+    """Looks up the values of a column of a dataframe in an index, and
+        puts the results in a new column (or replaces the column).
+
+    Args:
+        df (pd.DataFrame): the dataframe
+        column (str): the column of keys to look up
+        index (LookupIndex): the index to look them up in
+        new_column (str): the column for the results. If None, column is
+            replaced.
+        missing (str): one of MISSING_POLICIES. "drop" removes the rows
+            whose key is not found.
+
+    Returns:
+        pd.DataFrame: a copy of df with the looked up values
+    """
+    if missing == "drop":
+        df = df[index.contains(df[column])]
+        missing = "raise"
+    looked_up = index.lookup(df[column], missing=missing)
+    return df.assign(**{new_column or column: looked_up})
@@ -1,24 +1,19 @@
-import yaml
-import pandas as pd
-import numpy as np
+import argparse
 import os
-import re
-from functools import cache
-from fuzzywuzzy import process, fuzz
-
-from time import sleep
-
-# Load config
-config = yaml.safe_load(open('config.yml'))
+import time
 
-VERBOSE = config['verbose']
-
-# reading all the meta data in from url
-meta_url = config['meta_url']
-meta_data_df = pd.read_json(meta_url, orient='index')
+import numpy as np
+import pandas as pd
 
-# Verbose setting for print outs
-VERBOSE = False
+from artifacts import ArtifactStore
+from indicators import IndicatorIds
+from instrumentation import StageRecorder
+from lookup import LookupIndex, v_lookup
+from metadata import read_metadata
+from pipeline import RunContext, Stage, load_config, run_stages, select_stages
+from scheduler import schedule_summary
+from selection import compile_criteria, only_uk_data_mask, select
+from term_matcher import get_term_matcher
 
 
 def in_path(file_name):
@@ -26,11 +21,6 @@ def in_path(file_name):
     return os.path.join("inputs", file_name)
 
 
-def out_path(file_name):
-    "Creates a file path for output files"
-    return os.path.join("outputs", file_name)
-
-
 def keep_needed_df_cols(df: pd.DataFrame, required_col_list: list):
     """Drops uneeded columns from a datframe using a list of the
         required columns.
@@ -44,57 +34,7 @@ def keep_needed_df_cols(df: pd.DataFrame, required_col_list: list):
     return df
 
 
-# dropping uneeded cols
-REQD_COLS = config['required_cols']
-meta_data_df = keep_needed_df_cols(meta_data_df, REQD_COLS)
-
-# Identifying proxy terms
-proxy_terms_list = config['proxy_terms']
-
-# other_info col has "None" in, which needs to be nan
-meta_data_df.other_info.replace("None", np.nan, inplace=True)
-
-
-def regex_or_str(termslist: list):
-    """Joins items of a list with the regex OR operator
-        Getting terms of the list into str for regex with OR |
-
-    Args:
-        termslist (list): list of terms (strings) that should be joined
-            with the | operator.
-
-    Returns:
-        re.Pattern: the regex pattern in unicode
-    """
-    regex_terms = ''
-    for item in termslist:
-        if item == termslist[0]:
-            regex_terms += "\\b"
-        regex_terms += item
-        if item != termslist[-1]:
-            regex_terms += "\\b|\\b"
-        else:
-            regex_terms += "\\b"
-    # raw_regex_terms = r"{}".format(regex_terms)
-    return re.compile(regex_terms)
-
-
-proxy_terms = regex_or_str(proxy_terms_list)
-
-# I am sure there's a better way to do this.
-# TODO: optimise proxy_terms_list creation
-# proxy_terms = ''.join(config['proxy_terms']).replace(" ", "|")
-
-# Make proxy boolean mask
-proxy_boolean = (meta_data_df
-                 .other_info
-                 .str.contains(proxy_terms, na=False, regex=True))
-
-# Create new col, 'proxy_indicator'
-meta_data_df['proxy_indicator'] = proxy_boolean
-
-
-def check_if_proxies_contain_official():
+def check_if_proxies_contain_official(meta_data_df: pd.DataFrame):
     """Checks if the records which contain the proxy key words in the
         other_info column also contain the official wording to say that
         the stats follow the UN specification, which would imply a
@@ -114,111 +54,19 @@ def check_if_proxies_contain_official():
     return contradictions_list
 
 
-# Using this function as a quality check
-# This will check that none of datasets that proxy_indicator = True
-# contain this official sentence specifed in the config file.
-check_if_proxies_contain_official()
-
-# cleaning up the national_geo col, as nans seem to be inconsistent.
-meta_data_df.national_geographical_coverage = (meta_data_df
-                                               .national_geographical_coverage
-                                               .str.replace("nan", "None"))
-
-# Remove archived indicators as these datasets are  no longer current.
-meta_data_df = meta_data_df[~meta_data_df.index.str.contains("archived")]
-
-
-def get_disag_report(disag_url):
+def get_disag_report(ctx: RunContext, disag_url):
     """Gets the disagregation report from the URL specified in the
         config file then it changes the indicator names so they are
         the same as metadata df"""
     # Pulling disagg report
-    disag_df = pd.read_csv(disag_url)
+    disag_df = pd.read_csv(ctx.http_cache.fetch(disag_url))
     # Alter the indicator names so they match the other df
     disag_df.Indicator = disag_df.Indicator.str.lstrip("#")
     return disag_df
 
-# Get the disagregation report for all datasets
-
-
-DISAG_URL = config['disag_url']
-disag_df = get_disag_report(DISAG_URL)
-
-# Checking if Disaggregations col contains keywords geo_disag_terms
-# which are specified in the config
-GEO_DISAG_TERMS_LIST = config['geo_disag_terms']
-# Join terms in list with regex or operator
-geo_disag_terms = regex_or_str(GEO_DISAG_TERMS_LIST)
-
-# Creating boolean to indicate whether those geographic
-# disagregation terms are present
-if VERBOSE:
-    print("Searching for ", geo_disag_terms)
-disag_boolean = (disag_df
-                 .Disaggregations
-                 .str.contains(geo_disag_terms, regex=True))
-disag_df['geo_disag'] = disag_boolean
-if VERBOSE:
-    print("Disagregation boolean counts: ", disag_boolean.value_counts())
-
-# Drop the now uneeded Disaggregations cols
-required_disag_cols = config["required_disag_cols"]
-disag_df = keep_needed_df_cols(disag_df, required_disag_cols)
-
-# Set the indicator number as the index and then merge on index
-disag_df.set_index("Indicator", inplace=True)
-# Left joining df onto disag_df
-meta_data_df = meta_data_df.join(disag_df)
-
-# Replacing nans with False in the geo_disag series
-# This could have been done with `na=False`, in the original str.contains
-# expression. Can be changed improved later.
-# This is necessary because if
-meta_data_df.geo_disag.replace(np.nan, False, inplace=True)
-
-# Creating local variable to map for uk coverage
-uk_terms_list = config['uk_terms']
-
-
-def check_only_uk_data(nat_geo_series, geo_disag_series, uk_terms):
-    """Checks if Both of these conditions need to met
-        1) value in the national_geographical_coverage is listed in uk_terms
-        2) value in geo_disag column is FALSE
-        and returns True if conditions are met, False otherwise.
-        Function to be used to map/apply to create new series
-    Args:
-        nat_geo_series (pd.Series): The national_geographical_coverage series
-        geo_disag_series (pd.Series): The geo_disag series
-    Returns:
-        Boolean : True if conditions are met, False otherwise.
-    """
-    if nat_geo_series in uk_terms and geo_disag_series is False:
-        return True
-    return False
-
-
-# Applying check_only_uk_data to map True/False to 'only_uk_data' series
-meta_data_df['only_uk_data'] = (meta_data_df.apply(
-                                lambda x: check_only_uk_data
-                                (x.national_geographical_coverage,
-                                 x.geo_disag,
-                                 uk_terms_list),
-                                axis=1))
 
-# Making UK terms uniform --> United Kingdom
-uk_terms_reg = regex_or_str(uk_terms_list)
-print("Searching for regex string", uk_terms_reg)
-meta_data_df.national_geographical_coverage = (meta_data_df
-                                               .national_geographical_coverage
-                                               .str.replace(uk_terms_reg,
-                                                            "United Kingdom",
-                                                            regex=True))
-
-# Including 8-1-1 by setting proxy to false as it was wrongly exlcuded.
-meta_data_df.loc['8-1-1', 'proxy_indicator'] = False
-
-
-def df_sorter(df: pd.DataFrame, sort_order: list) -> pd.DataFrame:
+def df_sorter(df: pd.DataFrame, sort_order: list,
+              indicator_ids: IndicatorIds = None) -> pd.DataFrame:
     """Sorts a dataframe which has indicators as strigns, such as
         '1-2-1', then it sorts them according to the hierache in the
         config file.
@@ -226,314 +74,52 @@ def df_sorter(df: pd.DataFrame, sort_order: list) -> pd.DataFrame:
             then by
         Target: numeric then alphabetic
             then by
-        Target: numeric
+        Indicator: numeric
 
     Args:
         df (pd.DataFrame): A pandas dataframe to be sorted, which has
             indicators as its index
         sort_order (list): the order in which the indicators should be
             sort
+        indicator_ids (IndicatorIds): the parsed ids of the index of df,
+            if they have already been parsed
 
     Returns:
-        pd.DataFrame: a pandas dataframe sorted as required.
-    """
-    df.reset_index(inplace=True)
-
-    # renaming goal target indicator - for sorting purposes
-    df.rename(columns={"index": "g-t-i"}, inplace=True)
-    # As it should be sorted by goal, target, then indicator
-    # They must be split up in order to sort on them individually
-    # Using the sort_order as column names here to receive the split
-    df[sort_order] = meta_data_df['g-t-i'].str.split("-", expand=True)
-    # Now usign the sort order with the sort_values method on the df
-    df.sort_values(sort_order, axis=0, inplace=True)
-    # After the sort, now dropping unneeded columns
-    df.drop([*sort_order, "g-t-i"], axis=1)
-    # Now re-setting the index as the combined goal, target, indicator number
-    df.set_index("g-t-i", inplace=True)
-    return df
-
-
-# Applying the df_sorter function using the sort order specified in the config
-sort_order = config["sort_order"]
-meta_data_df = df_sorter(meta_data_df, sort_order)
-
-if VERBOSE:
-    print("===============Printing head of meta_data_df===============")
-    print(meta_data_df.head(20))
-
-intermediate_outputs = config['intermediate_outputs_needed']
-if intermediate_outputs:
-    # Get output filename from config to create path
-    meta_data_out_path = out_path(config['meta_outfile'])
-    # write meta data out to csv
-    meta_data_df.to_csv(meta_data_out_path)
-
-
-def build_SQL_query(query_words: dict) -> str:
+        pd.DataFrame: a pandas dataframe sorted as required, with its
+            index named "g-t-i"
     """
-    Builds an SQL style query string from a dictionary
-        where keys are column titles and values are values
-        that the query will test for.
+    if indicator_ids is None:
+        indicator_ids = IndicatorIds(df.index)
+    # The ids are sorted on their parsed goal, target and indicator
+    # numbers, so no string splitting is needed
+    sorted_df = df.iloc[indicator_ids.sort_order(sort_order)]
+    return sorted_df.rename_axis("g-t-i")
 
-    Args:
-        query_words (dict): a dictionary where keys are column
-            titles and values are values
 
-    Returns:
-        str: an string that can be used as an SQL query
-    """
-    query_string = ''
-    for col_nm, col_val in query_words.items():
-        if col_val not in [True, False]:
-            col_val = f"'{col_val}'"
-        query_string += f"{col_nm}=={col_val}"
-        if col_nm != list(query_words.keys())[-1]:
-            query_string += " & "
-    return query_string
-
-
-# Make the df of included indicators
-# Get SDMX suitability test
-suitability_dict = config['suitability_test']
-query_string = build_SQL_query(suitability_dict)
-if VERBOSE:
-    print("Querying meta_data_df for ", query_string)
-
-inc_df = meta_data_df.query(query_string)
-
-# Manually dropping '13-2-2', '17-5-1', '17-6-1' from df because
-# they have been changed into the 2020 indicators, so we do not want to
-# consider them for SDMX at this point
-inc_df = inc_df.drop(config["2020indicators"], axis=0)
-
-print(f"The shape of inc_df is {inc_df.shape}")
-
-# Getting unique column headers in included datasets only
-disag_series = (get_disag_report(DISAG_URL)
-                .loc[:, ["Indicator", "Disaggregations"]]
-                .set_index("Indicator"))
-
-
-# Filtering the disaggregation dataframe
-filtered_disags_df = disag_series.join(inc_df, how="inner")
-if VERBOSE:
-    print(f"The shape of filtered_disags_df is {filtered_disags_df.shape}")
-# Splitting up the terms in the Disaggregations column
-split_disags = filtered_disags_df["Disaggregations"].str.split(", ")
-# Explode the lists that are the result of the split.
-# Exploded lists --> rows in the Series
-unique_disags = split_disags.explode().unique()
-
-# write out the csv
-if intermediate_outputs:
-    # Creating a dictionary ready top build
-    # Column names should be sdg_column_name, SDMX_concept_name (empty column)
-    df_build_dict = {
-        "sdg_column_name": unique_disags,
-        "SDMX_concept_name": np.empty_like(unique_disags)
-    }
-    sdg_cols_out_path = out_path(config["sdg_cols_outfile"])
-    pd.DataFrame(data=df_build_dict).to_csv(sdg_cols_out_path)
-
-# Ticket #19
-# The excel file should have been manually updated with mappings
-# from SDG column names to their SDMX concept name mapping
-# Import the manually updated file
-SDG_SDMX_MANUAL_EXCEL_FILE = config["manual_excel_file_name"]
-WANTED_COLS = ["sdg_column_name", "SDMX_concept_name"]
-DROP_COLS = ["SDMX_concept_name"]
-
-
-def manual_excel(excel_file, wanted_cols, drop_cols=None):
-    try:
-        excel_path = in_path(excel_file)
-        df = pd.read_excel(excel_path,
-                           usecols=wanted_cols,
-                           engine="openpyxl")
-        if drop_cols:
-            df.dropna(axis=0, subset=drop_cols, inplace=True)
-        print(f"{excel_file} has been imported.")
-        return df
-    except Exception as ex:
-        print(f"""There has been an error with the import of the
-                    manually updated Excel file \n Check that the
-                    dependecies (openpyxl) are installed and that
-                    the file is named correctly in config
-                    \n\n
-                    Error Message: {ex}""")
-
-
-# Make a df of the columns names that have been mapped.
-# This is the sdg_column_name (disagregation name) and SDMX_concept_name
-mapped_columns_df = manual_excel(SDG_SDMX_MANUAL_EXCEL_FILE,
-                                 WANTED_COLS,
-                                 DROP_COLS)
-
-# Get all disagregation values and match them with their
-# respective column titles. Output as a df and csv
-
-# Build URLs to get the live data
-URL_prefix = config['URL_prefix']
-URL_suffix = config['URL_suffix']
-
-col_name_slugs = (mapped_columns_df
-                  .sdg_column_name
-                  .str.lower()
-                  .str.replace(" ", "-"))
-
-# This will creat the correct URL for each disagregation name
-mapped_columns_df["disag_val_urls"] = URL_prefix + col_name_slugs + URL_suffix
-
-# Empty lists to capture the column names and values
-col_names = []
-col_values = []
-# Grab the column names and their respective URL values csv resource
-col_series = mapped_columns_df.sdg_column_name
-value_urls = mapped_columns_df.disag_val_urls
-
-# Iterate through disagregation names and URLs to read
-# the disaggregation values
-
-for col_name, url in zip(col_series, value_urls):
-    # Get all the value disaggregations for each column
-    values = pd.read_csv(url, usecols=["Value"]).to_numpy()
-    # Iterating through all the disagregation values
-    for value in values:
-        col_names.append(col_name)
-        col_values.append(*value)
-# Creating and empty array in the right shape for df building
-emptycells = np.empty_like(col_names)
-construct_dict = {"column_value": col_values,
-                  "sdg_column_name": col_names,
-                  "SDMX_code": emptycells,
-                  "comments": emptycells}
-
-# Creating the dataframe of all disagregatio values matched
-# with their respective parent disaggregation names
-val_col_pairs_df = pd.DataFrame(construct_dict)
-
-
-# Outputting the matched disaggregation values and
-# parent disaggregation values matched if needed.
-if intermediate_outputs:
-    val_col_pairs_path = out_path(config['val_col_file'])
-    val_col_pairs_df.to_csv(val_col_pairs_path)
-
-
-@cache  # Caching provides a 20x speed-up here
-def get_SDMX_colnm(search_value):
-    # TODO: create a more generic v_lookup type function
-    """Gets the SDMX equivilent of all of the SDG disaggregation
-        names, by looking up the SDG disaggregation name. To be
-        used on a the sdg_column_name column of the dataframe
-        containing the SDG dissagregation names. It looks up the values
-        sdg_column_name column and returns their equivilent from
-        SDMX_concept_name column of `mapped_columns_df` which came from the
-
-        manual-input Excel file.
+def manual_excel(excel_file, wanted_cols, drop_cols=None,
+                 cache_dir=".workbook_cache"):
+    """Gets columns of a manually updated Excel file in the inputs folder.
+        The workbook is only parsed once for each version of it; the
+        columns are taken from the parsed copy.
 
     Args:
-        search_value (str): strings from the sdg_column_name column
-
-    Returns:
-        str: SDMX concept name equivilent
+        excel_file (str): the name of the file in the inputs folder
+        wanted_cols (list): the columns needed
+        drop_cols (list): rows missing a value in any of these columns
+            are dropped
+        cache_dir (str): folder in which parsed workbooks are kept
+
+    Raises:
+        ManualWorkbookError: if the file is missing or cannot be read, or
+            does not have the wanted columns
     """
-    val_df = (mapped_columns_df[mapped_columns_df
-                                .sdg_column_name == search_value])
-    row = val_df.index[0]
-    val = val_df.loc[:].at[row, "SDMX_concept_name"]
-    return val
-
-
-# Creating a new column in val_col_pairs df called sdmx_col_nm
-# which contains the SDMX equivilent of all of the SDG column names
-val_col_pairs_df["sdmx_col_nm"] = (val_col_pairs_df
-                                   .sdg_column_name
-                                   .apply(lambda x: get_SDMX_colnm(x)))
-
-# Dropping the old SDG column names
-val_col_pairs_df.drop(columns=["sdg_column_name"], inplace=True)
-# Renaming the SDMX col names as "column_name"
-# TODO: column_name should probably be renamed "disaggregation name"
-val_col_pairs_df.rename(columns={"sdmx_col_nm": "column_name",
-                        "SDMX_code": "sdmx_code"},
-                        inplace=True)
-# Reordering columns as required
-
-order_cols = ['column_name', 'column_value', 'sdmx_code', 'comments']
-val_col_pairs_df = val_col_pairs_df[order_cols]
-
-# De-duping column_value and column_name because there will be some duplicates
-before_shape = val_col_pairs_df.shape
-val_col_pairs_df.drop_duplicates(subset=["column_name",
-                                         "column_value"],
-                                 inplace=True)
-after_shape = val_col_pairs_df.shape
-
-if VERBOSE:
-    print(f"""De-depuping finished.
-      {before_shape[0] - after_shape[0]} records were dropped.""", end="")
-
-# Outputting result to csv
-if intermediate_outputs:
-    val_col_pairs_df.to_csv("SDMX_colnames_values_matched-#21.csv")
-
-# Import the International DSD
-dsd_xls = pd.ExcelFile(config['dsd_url'])
-
-concept_sch = (pd.read_excel(dsd_xls,
-                             engine="openpyxl",
-                             sheet_name="3.Concept Scheme",
-                             skiprows=11,
-                             header=0,
-                             usecols=[2, 7]))
-
-
-def get_dsd_tab_name(concept_sch, concept_name):
-    """ This function looks up the correct Excel tab name
-        by finding the row in which the Concept Name column
-        in the schema is the same as the concept_name (a search term
-        supplied as a parameter to the function).
-
-        For example if the Concept Name is "Income or wealth quantile"
-        this would be on line 14 of the schema. So the function will
-        the value that is in the "Code List or Uncoded" on line 14
-        of the schema, which is "CL_QUANTILE", which is the correct
-        name of the tab in the Excel sheet.
-        """
-    res = concept_sch[concept_sch['Concept Name:en'] == concept_name]
-    if res.shape[0] > 0:
-        row_num = res.index[0]
-        return res.at[row_num, "Code List or Uncoded"]
-    else:
-        print(f"Skipping {concept_name}; not found in the concept scheme")
-        return None
-
+    from workbooks import select_columns
 
-dsd_code_name_list_dict = {}
-# Get every unique column (disaggregation) name and iterate through
-for col_name in val_col_pairs_df.loc[:, 'column_name'].unique():
-    # get the correct tab name in the excel sheet for that disaggregation
-
-    tab_name = get_dsd_tab_name(concept_sch, col_name)
-    if not tab_name:
-        print(f"Warning: No tab name for {col_name} was found")
-        continue
-    # Get the SDMX data from the correct tab in the spreadsheet.
-    dsd_from_tab = pd.read_excel(dsd_xls,
-                                 engine="openpyxl",
-                                 sheet_name=f"{tab_name.upper()}",
-                                 skiprows=12,
-                                 header=0,
-                                 usecols=[0, 4])
-    # Column 0 is the SDMX code, 1 is the SDMX name (more human friendly)
-    # Make a dictionary to enable mapping from SDMX names --> SDMX codes
-    names = dsd_from_tab.iloc[:, 1].to_list()
-    codes = dsd_from_tab.iloc[:, 0].to_list()
-    # Put the SDMX codes and names into a dictionary for user choosing later.
-    dsd_code_name_list_dict[col_name] = {name: code for name, code
-                                         in zip(names, codes)}
+    df = select_columns(in_path(excel_file), cache_dir, wanted_cols)
+    if drop_cols:
+        df.dropna(axis=0, subset=drop_cols, inplace=True)
+    print(f"{excel_file} has been imported.")
+    return df
 
 
 def _valid_int_input(prompt, highest_input):
@@ -544,11 +130,11 @@ def _valid_int_input(prompt, highest_input):
             inp = int(input(prompt))
             if inp > highest_input:
                 print("\n That value is too high. Try again")
-                sleep(0.5)
+                time.sleep(0.5)
                 continue
             elif inp < 1:
                 print("\n That value is too low. Try again")
-                sleep(0.5)
+                time.sleep(0.5)
                 continue
             return inp
         except ValueError as e:
@@ -562,42 +148,30 @@ Choose a number from above options to select best matching SDMX value.
 Or press {} if there is no suitable match:  """
 
 
-def _get_name_list(column_name, dsd_code_list_dict=dsd_code_name_list_dict):
-    """Internal function created to simplify the suggest_dsd_value function.
-        Creates a list from the code name list dictionary's keys
-        for any particular column"""
-    return dsd_code_list_dict[column_name].keys()
-
-
-def suggest_dsd_value(column_name: str, sdg_column_value: str,
-                      dsd_code_list_dict: dict):
+def suggest_dsd_value(sdg_column_value: str, possible_matches: list,
+                      code_name_dict: dict):
     """This functions assists users to select an SDMX value from the DSD
         when matching values from the SDG data. Rather than having to search
         through the column on the correct tab manually.
 
-        The function uses the fuzzywuzzy library to select similar values
-        to the one to be matched from the SDG data. The user is then
+        The similar values to the one to be matched from the SDG data are
+        found beforehand by the match_values stage. The user is then
         presented with the options, or and option to choose "None" if they
         see no good match among the options presented to them.
 
     Args:
-        column_name (str): name of the column to be searched for values
         sdg_column_value (str): the value from the SDG data which is being
             searched for
-        dsd_code_list_dict (dict): A dictionary of the SDMX codes (ID)
-            and their human readable (e.g. English) names
+        possible_matches (list): (SDMX name, score) of the best matches,
+            best first
+        code_name_dict (dict): A dictionary of the human readable (e.g.
+            English) names and their SDMX codes (ID) for the column
 
     Returns:
         (str, str): i) The SDMX code of the SDMX name chosen by the user
                         or "None"
                     ii) A comment about how the code was chosen
     """
-
-    dsd_code_list = _get_name_list(column_name, dsd_code_list_dict)
-    possible_matches = process.extract(sdg_column_value,
-                                       dsd_code_list,
-                                       scorer=fuzz.partial_token_sort_ratio,
-                                       limit=8)
     if any(possible_matches):
         count_matches = len(possible_matches)
         # get the index/position of the last option in the list, for None
@@ -614,8 +188,7 @@ def suggest_dsd_value(column_name: str, sdg_column_value: str,
         if user_match_choice < count_matches:
             selected_match = possible_matches[user_match_choice][0]
             print(f"\nChosen value: {selected_match}")
-            sleep(0.75)
-            sdmx_code_ = dsd_code_list_dict[column_name][selected_match]
+            sdmx_code_ = code_name_dict[selected_match]
             return sdmx_code_, "Matching SDG value was manually chosen"
         elif user_match_choice == count_matches:
             # This should catch the "None" option, usually 9
@@ -625,108 +198,1088 @@ def suggest_dsd_value(column_name: str, sdg_column_value: str,
     return "None", f"Automatic. No matches found for {sdg_column_value}"
 
 
-# Function to map "Name:en" to "Code*"
-# Set map_manual_names_to_codes if you have a manually edited file
-# that needs mapping from SDMX names (English) to SDMX concept codes.
-
-# Controls if the disaggregation codes are to be
-# manually mapped again
-manually_choose_code_mapping = config['manually_choose_code_mapping']
-
-if manually_choose_code_mapping:
-    # Setting up a dictionary to ready for the construction of the
-    # dataframe for output
-    code_comments_dict = {"index_code": [], "sdmx_code": [], "comments": []}
-
-    all_records = val_col_pairs_df.shape[0]
-    for i, row in enumerate(val_col_pairs_df.iterrows()):
-        print(f"Progress: {(i/all_records)*100:.2f}%")
-        index_number = row[0]
-        sdmx_code, comments = (suggest_dsd_value
-                               (row[1].column_name,
-                                row[1].column_value,
-                                dsd_code_name_list_dict))
-        print(f"\nCorresponding code: {sdmx_code}\n")
-        sleep(1)
-        code_comments_dict["index_code"].append(index_number)
-        code_comments_dict["sdmx_code"].append(f"'{sdmx_code}'")
-        code_comments_dict["comments"].append(comments)
-
-    match_values_df = (pd.DataFrame
-                       .from_dict(code_comments_dict)
-                       .set_index("index_code"))
-
-    match_values_df.rename(columns={"index_code": "index"}, inplace=True)
-
-    val_col_pairs_df.drop(['sdmx_code', 'comments'], axis=1, inplace=True)
-    val_col_pairs_df = val_col_pairs_df.join(match_values_df)
-
-    print(val_col_pairs_df.sample(20))
-
-
-if intermediate_outputs:
-    manual_chosen_vals_out_path = out_path(config['manual_names_to_codes'])
-    val_col_pairs_df.to_excel(manual_chosen_vals_out_path)
-    manual_chosen_vals_out_path_csv = (out_path
-                                       (config['manual_names_to_codes_csv']))
-    val_col_pairs_df.to_csv(manual_chosen_vals_out_path_csv, quotechar="'")
-
-
-# Code Mapping in correct format as reuired for SDMX
-WANTED_COLS_CODE_MAPPING = ["column_value", "column_name", "sdmx_code"]
-code_mapping_df = (manual_excel
-                   ("manually_chosen_values_corrected.xlsx",
-                    WANTED_COLS_CODE_MAPPING))
-
-
-# The concept names need mapping to the concept IDs which come from the DSD
-# Import the needed columns from the DSD for the name --> concept ID mapping
-concept_id_names_df = pd.read_excel(dsd_xls,
-                                    engine="openpyxl",
-                                    sheet_name="3.Concept Scheme",
-                                    skiprows=11,
-                                    header=0,
-                                    usecols=[1, 7])
-# Get a dictionary for the name-->ID mapping, with this slightly hacky code
-concept_id_names_df.rename(columns={'Concept Name:en': "concept_name",
-                                    'Concept ID': 'concept_id'},
+def load_metadata(ctx: RunContext):
+    """Stage: reads the meta data of all indicators and the disaggregation
+        report, and adds the columns used to test their suitability."""
+    config = ctx.config
+
+    # reading the meta data in from url, keeping only the needed cols.
+    # Archived indicators are left out as these datasets are no longer
+    # current.
+    meta_url = config['meta_url']
+    REQD_COLS = config['required_cols']
+    meta_data_df = read_metadata(ctx.http_cache.fetch(meta_url), REQD_COLS)
+
+    # Identifying proxy terms
+    case_sensitive = config['case_sensitive_terms']
+    proxy_matcher = get_term_matcher(config['proxy_terms'], case_sensitive)
+
+    # other_info col has "None" in, which needs to be nan
+    meta_data_df['other_info'] = meta_data_df.other_info.replace("None",
+                                                                 np.nan)
+
+    # Find which proxy term (if any) is in other_info, so the proxy
+    # flags can be checked
+    meta_data_df['proxy_term'] = (proxy_matcher
+                                  .matched_term(meta_data_df.other_info))
+
+    # Create new col, 'proxy_indicator'
+    meta_data_df['proxy_indicator'] = meta_data_df.proxy_term.notna()
+
+    # Using this function as a quality check
+    # This will check that none of datasets that proxy_indicator = True
+    # contain this official sentence specifed in the config file.
+    check_if_proxies_contain_official(meta_data_df)
+
+    # cleaning up the national_geo col, as nans seem to be inconsistent.
+    meta_data_df.national_geographical_coverage = (
+        meta_data_df
+        .national_geographical_coverage
+        .str.replace("nan", "None"))
+
+    # The ids are parsed once here and used for the joins and sort below.
+    meta_ids = IndicatorIds(meta_data_df.index)
+
+    # Get the disagregation report for all datasets
+    DISAG_URL = config['disag_url']
+    disag_report_df = get_disag_report(ctx, DISAG_URL)
+    # The report is also used by select_indicators, so it is kept as read
+    disag_df = disag_report_df.copy()
+
+    # Checking if Disaggregations col contains keywords geo_disag_terms
+    # which are specified in the config
+    geo_disag_matcher = get_term_matcher(config['geo_disag_terms'],
+                                         case_sensitive)
+
+    # Creating boolean to indicate whether those geographic
+    # disagregation terms are present
+    if ctx.verbose:
+        print("Searching for ", geo_disag_matcher.pattern)
+    disag_boolean = geo_disag_matcher.contains(disag_df.Disaggregations)
+    disag_df['geo_disag'] = disag_boolean
+    if ctx.verbose:
+        print("Disagregation boolean counts: ",
+              disag_boolean.value_counts())
+
+    # Drop the now uneeded Disaggregations cols
+    required_disag_cols = config["required_disag_cols"]
+    disag_df = keep_needed_df_cols(disag_df, required_disag_cols)
+
+    # Left joining disag_df onto df, on the parsed indicator keys
+    disag_keys = IndicatorIds(disag_df.Indicator).keys
+    meta_keys = pd.Series(meta_ids.keys, index=meta_data_df.index)
+    for col in disag_df.columns.drop("Indicator"):
+        meta_data_df[col] = LookupIndex(disag_keys,
+                                        disag_df[col]).lookup(meta_keys)
+
+    # Replacing nans with False in the geo_disag series
+    # This is necessary because indicators that are missing from the
+    # disaggregation report get nan from the join
+    meta_data_df['geo_disag'] = meta_data_df.geo_disag.replace(np.nan, False)
+
+    # Creating local variable to map for uk coverage
+    uk_terms_list = config['uk_terms']
+
+    # Testing every row at once to map True/False to 'only_uk_data' series
+    meta_data_df['only_uk_data'] = only_uk_data_mask(
+        meta_data_df.national_geographical_coverage,
+        meta_data_df.geo_disag,
+        uk_terms_list)
+
+    # Making UK terms uniform --> United Kingdom
+    uk_matcher = get_term_matcher(uk_terms_list, case_sensitive)
+    print("Searching for regex string", uk_matcher.pattern)
+    meta_data_df.national_geographical_coverage = (
+        uk_matcher.replace(meta_data_df.national_geographical_coverage,
+                           "United Kingdom"))
+
+    # Including 8-1-1 by setting proxy to false as it was wrongly exlcuded.
+    meta_data_df.loc[meta_ids.isin(['8-1-1']), 'proxy_indicator'] = False
+
+    # Applying the df_sorter function using the sort order specified
+    # in the config
+    sort_order = config["sort_order"]
+    meta_data_df = df_sorter(meta_data_df, sort_order, meta_ids)
+
+    if ctx.verbose:
+        print("===============Printing head of meta_data_df===============")
+        print(meta_data_df.head(20))
+
+    if ctx.intermediate_outputs:
+        # write meta data out, named as in the config
+        ctx.writer.write_intermediate(meta_data_df, config['meta_outfile'])
+
+    return {"meta_data_df": meta_data_df, "disag_report_df": disag_report_df}
+
+
+def select_indicators(ctx: RunContext, meta_data_df: pd.DataFrame,
+                      disag_report_df: pd.DataFrame):
+    """Stage: selects the indicators that pass the suitability test and
+        finds the disaggregation names that they use."""
+    config = ctx.config
+
+    # Make the df of included indicators
+    # Get SDMX suitability test
+    criteria = compile_criteria(config['suitability_test'])
+    inc_df, selection_report_df = select(meta_data_df, criteria)
+    print("Indicators eliminated by each criterion of the suitability test")
+    print(selection_report_df.to_string(index=False))
+
+    # Manually dropping '13-2-2', '17-5-1', '17-6-1' from df because
+    # they have been changed into the 2020 indicators, so we do not want to
+    # consider them for SDMX at this point
+    inc_ids = IndicatorIds(inc_df.index)
+    kept = ~inc_ids.isin(config["2020indicators"])
+    inc_df = inc_df[kept]
+    inc_ids = inc_ids.take(kept)
+
+    print(f"The shape of inc_df is {inc_df.shape}")
+
+    # Getting unique column headers in included datasets only, by
+    # filtering the disaggregation report on the parsed indicator keys
+    included = np.isin(IndicatorIds(disag_report_df.Indicator).keys,
+                       inc_ids.keys)
+    filtered_disags_df = (disag_report_df
+                          .loc[included, ["Indicator", "Disaggregations"]]
+                          .set_index("Indicator"))
+    if ctx.verbose:
+        print("The shape of filtered_disags_df is "
+              f"{filtered_disags_df.shape}")
+    # Splitting up the terms in the Disaggregations column
+    split_disags = filtered_disags_df["Disaggregations"].str.split(", ")
+    # Explode the lists that are the result of the split.
+    # Exploded lists --> rows in the Series
+    unique_disags = split_disags.explode().unique()
+
+    # write out the csv
+    if ctx.intermediate_outputs:
+        # Creating a dictionary ready top build
+        # Column names should be sdg_column_name, SDMX_concept_name
+        # (empty column)
+        df_build_dict = {
+            "sdg_column_name": unique_disags,
+            "SDMX_concept_name": np.empty_like(unique_disags)
+        }
+        ctx.writer.write_intermediate(pd.DataFrame(data=df_build_dict),
+                                      config["sdg_cols_outfile"])
+
+    return {"inc_df": inc_df,
+            "unique_disags": unique_disags,
+            "selection_report_df": selection_report_df}
+
+
+def get_mapped_columns(config: dict) -> pd.DataFrame:
+    """Gets the SDG column names that have been mapped to SDMX concept
+        names in the manually updated Excel file, with the URL of the
+        csv of values of each of them."""
+    # Ticket #19
+    # The excel file should have been manually updated with mappings
+    # from SDG column names to their SDMX concept name mapping
+    # Import the manually updated file
+    WANTED_COLS = ["sdg_column_name", "SDMX_concept_name"]
+    DROP_COLS = ["SDMX_concept_name"]
+
+    # Make a df of the columns names that have been mapped.
+    # This is the sdg_column_name (disagregation name) and SDMX_concept_name
+    mapped_columns_df = manual_excel(config["manual_excel_file_name"],
+                                     WANTED_COLS,
+                                     DROP_COLS,
+                                     cache_dir=config['workbook_cache_dir'])
+
+    # Build URLs to get the live data
+    URL_prefix = config['URL_prefix']
+    URL_suffix = config['URL_suffix']
+
+    col_name_slugs = (mapped_columns_df
+                      .sdg_column_name
+                      .str.lower()
+                      .str.replace(" ", "-"))
+
+    # This will creat the correct URL for each disagregation name
+    mapped_columns_df["disag_val_urls"] = (URL_prefix
+                                           + col_name_slugs
+                                           + URL_suffix)
+    return mapped_columns_df
+
+
+def collect_values(ctx: RunContext):
+    """Stage: reads the values of every manually mapped disaggregation
+        and pairs them with their SDMX concept names."""
+    from fetching import fetch_many
+
+    config = ctx.config
+
+    mapped_columns_df = get_mapped_columns(config)
+
+    # Get all disagregation values and match them with their
+    # respective column titles. Output as a df and csv
+
+    # Grab the column names and their respective URL values csv resource
+    col_series = mapped_columns_df.sdg_column_name
+    value_urls = mapped_columns_df.disag_val_urls
+
+    def read_disag_values(url):
+        """Reads the distinct values in the Value column of a
+            disaggregation values csv, and how many values there were"""
+        values = pd.read_csv(ctx.http_cache.fetch(url),
+                             usecols=["Value"]).Value
+        return values.drop_duplicates(), len(values)
+
+    # Read the disaggregation values for all disagregation names at once.
+    # The results come back in the same order as the URLs.
+    fetch_config = config['fetch']
+    value_results = fetch_many(value_urls,
+                               read_disag_values,
+                               max_workers=fetch_config['max_workers'],
+                               retries=fetch_config['retries'],
+                               backoff=fetch_config['backoff_seconds'])
+
+    failed_fetches = []
+    value_frames = []
+    values_read = 0
+    for col_name, result in zip(col_series, value_results):
+        if result.error is not None:
+            failed_fetches.append(result)
+            print(f"Could not get the values for {col_name} from "
+                  f"{result.url}. Error Message: {result.error}")
+            continue
+        # The distinct values of each column, with the column name
+        values, n_values = result.value
+        values_read += n_values
+        value_frames.append(pd.DataFrame({"column_value": values.to_numpy(),
+                                          "sdg_column_name": col_name}))
+    if failed_fetches:
+        print(f"{len(failed_fetches)} of {len(value_results)} "
+              "disaggregation value files could not be read and were "
+              "skipped.")
+
+    # Creating the dataframe of all disagregatio values matched
+    # with their respective parent disaggregation names, in one go.
+    # The column names are repeated many times so are kept as categories.
+    val_col_pairs_df = pd.concat(value_frames or
+                                 [pd.DataFrame(columns=["column_value",
+                                                        "sdg_column_name"])],
+                                 ignore_index=True)
+    val_col_pairs_df = val_col_pairs_df.assign(
+        sdg_column_name=val_col_pairs_df.sdg_column_name.astype("category"),
+        SDMX_code="",
+        comments="")
+
+    # Outputting the matched disaggregation values and
+    # parent disaggregation values matched if needed.
+    if ctx.intermediate_outputs:
+        ctx.writer.write_intermediate(val_col_pairs_df,
+                                      config['val_col_file'])
+
+    # Creating a new column in val_col_pairs df called sdmx_col_nm
+    # which contains the SDMX equivilent of all of the SDG column names
+    sdmx_colnm_index = LookupIndex.from_df(mapped_columns_df,
+                                           "sdg_column_name",
+                                           "SDMX_concept_name")
+    val_col_pairs_df = v_lookup(val_col_pairs_df, "sdg_column_name",
+                                sdmx_colnm_index, new_column="sdmx_col_nm",
+                                missing="raise")
+
+    # Dropping the old SDG column names
+    val_col_pairs_df.drop(columns=["sdg_column_name"], inplace=True)
+    # Renaming the SDMX col names as "column_name"
+    # TODO: column_name should probably be renamed "disaggregation name"
+    val_col_pairs_df.rename(columns={"sdmx_col_nm": "column_name",
+                            "SDMX_code": "sdmx_code"},
+                            inplace=True)
+    # Reordering columns as required
+
+    order_cols = ['column_name', 'column_value', 'sdmx_code', 'comments']
+    val_col_pairs_df = val_col_pairs_df[order_cols]
+
+    # Each column's values were de-duped as they were read. De-duping
+    # column_value and column_name again because SDG columns that map to
+    # the same SDMX concept can share values
+    val_col_pairs_df = (val_col_pairs_df
+                        .drop_duplicates(subset=["column_name",
+                                                 "column_value"])
+                        .astype({"column_name": "category"})
+                        .reset_index(drop=True))
+
+    if ctx.verbose:
+        print(f"""De-depuping finished.
+          {values_read - len(val_col_pairs_df)} records were dropped.""")
+
+    # Outputting the result
+    if ctx.intermediate_outputs:
+        ctx.writer.write_intermediate(val_col_pairs_df,
+                                      config['matched_values_file'])
+
+    return {"val_col_pairs_df": val_col_pairs_df}
+
+
+def load_dsd(ctx: RunContext):
+    """Stage: gets the International DSD workbook into the cache and parses
+        its concepts and codelists, unless this version of it has been
+        parsed before."""
+    from dsd import load_dsd_index
+
+    dsd_path = ctx.http_cache.fetch(ctx.config['dsd_url'])
+    dsd_index = load_dsd_index(dsd_path, ctx.config['dsd_cache_dir'])
+    return {"dsd_path": dsd_path, "dsd_index": dsd_index}
+
+
+def map_concepts(ctx: RunContext, val_col_pairs_df: pd.DataFrame,
+                 dsd_index):
+    """Stage: gets the codelist from the DSD for every SDMX concept used
+        by the disaggregations, and writes the column (disaggregation
+        name) mapping."""
+    config = ctx.config
+
+    # Dictionaries to map SDMX names --> SDMX codes, for each column
+    # (disaggregation) name, for user choosing later.
+    dsd_code_name_list_dict = {}
+    for col_name in val_col_pairs_df.loc[:, 'column_name'].unique():
+        if dsd_index.codelist_id(col_name) is None:
+            print(f"Skipping {col_name}; not found in the concept scheme")
+            continue
+        code_name_dict = dsd_index.code_names(col_name)
+        if code_name_dict is None:
+            print(f"Warning: No codelist tab for {col_name} was found")
+            continue
+        dsd_code_name_list_dict[col_name] = code_name_dict
+
+    # Column (disaggregation name) mapping in correct format for SDMX
+    WANTED_COLS_COL_MAPPING = ["sdg_column_name", "SDMX_Concept_ID"]
+    # Using the ExceFile object which is the manual chosen mapping
+    # for SDG column names to SDMX concepts
+    column_mapping_df = manual_excel(config["manual_excel_file_name"],
+                                     WANTED_COLS_COL_MAPPING,
+                                     cache_dir=config['workbook_cache_dir'])
+    # Drop empty rows
+    column_mapping_df.dropna(subset=["SDMX_Concept_ID"],
+                             axis='index',
+                             inplace=True)
+    # Rename column headers as required for SDMX
+    column_mapping_df.rename(columns={"sdg_column_name": "Text",
+                             "SDMX_Concept_ID": "Value"},
+                             inplace=True)
+    # Write SDMX formatted disaggregation names out to csv
+    column_mapping_out_path = ctx.out_path(config
+                                           ['column_mapping_out_file'])
+    ctx.writer.write_table(column_mapping_df, column_mapping_out_path)
+
+    return {"dsd_code_name_list_dict": dsd_code_name_list_dict,
+            "column_mapping_df": column_mapping_df}
+
+
+def match_values(ctx: RunContext, val_col_pairs_df: pd.DataFrame,
+                 dsd_code_name_list_dict: dict):
+    """Stage: scores every disaggregation value against the codelist of
+        its SDMX concept and writes the best matches to a table."""
+    from fuzzy_match import shortlist_recall, suggest_matches
+
+    config = ctx.config
+    blocking = config['fuzzy_match']['blocking']
+    suggestions_df = suggest_matches(val_col_pairs_df,
+                                     dsd_code_name_list_dict,
+                                     limit=config['fuzzy_match']['limit'],
+                                     blocking=blocking)
+    if blocking['check_recall']:
+        from decisions import DECISION_COLS
+
+        decisions_df = manual_excel(config['manual_chosen_codes_out_path'],
+                                    DECISION_COLS,
+                                    cache_dir=config['workbook_cache_dir'])
+        recall_df = shortlist_recall(decisions_df, dsd_code_name_list_dict,
+                                     blocking)
+        found = recall_df.in_shortlist.sum()
+        decisions = recall_df.decisions.sum()
+        print(f"{found} of the {decisions} manually chosen codes in "
+              f"codelists of more than {blocking['shortlist']} names were "
+              f"in the shortlist of {blocking['shortlist']} names")
+        for row in recall_df[recall_df.recall < 1].itertuples():
+            print(f"  {row.column_name}: {row.in_shortlist} of "
+                  f"{row.decisions}")
+    suggestions_out_path = ctx.out_path(config['fuzzy_match']
+                                        ['suggestions_file'])
+    ctx.writer.write_table(suggestions_df, suggestions_out_path, sep=",")
+    return {"suggestions_df": suggestions_df}
+
+
+def _under_review(column_name, column_value,
+                  review_dimension=None, review_value=None):
+    """Checks if a value has been picked out (with --review or
+        --review-value) to be chosen again, even if it is already decided.
+        A value already chosen again in a review session that was stopped
+        is not asked a third time."""
+    if review_dimension is None and review_value is None:
+        return False
+    return (review_dimension in (None, column_name)
+            and review_value in (None, column_value))
+
+
+def suggest_codes(ctx: RunContext, val_col_pairs_df: pd.DataFrame,
+                  dsd_code_name_list_dict: dict,
+                  suggestions_df: pd.DataFrame):
+    """Stage: the computer assisted mapping of disaggregation values to
+        SDMX codes, if switched on in the config. The choices are
+        written out for manual correction."""
+    config = ctx.config
+
+    # Function to map "Name:en" to "Code*"
+    # Set map_manual_names_to_codes if you have a manually edited file
+    # that needs mapping from SDMX names (English) to SDMX concept codes.
+
+    # Controls if the disaggregation codes are to be
+    # manually mapped again
+    manually_choose_code_mapping = config['manually_choose_code_mapping']
+
+    if manually_choose_code_mapping:
+        from decisions import (DECISION_COLS, DecisionJournal, DecisionStore,
+                               auto_decision)
+
+        # Setting up a dictionary to ready for the construction of the
+        # dataframe for output
+        code_comments_dict = {"index_code": [],
+                              "sdmx_code": [],
+                              "comments": []}
+
+        # Decisions from earlier sessions, and the choices in the manually
+        # corrected Excel file, are used rather than asking again
+        assist = config['code_mapping_assist']
+        decision_store = DecisionStore(in_path(assist['decisions_file']))
+        corrected_file = config['manual_chosen_codes_out_path']
+        if os.path.exists(in_path(corrected_file)):
+            corrected_df = manual_excel(corrected_file,
+                                        DECISION_COLS,
+                                        cache_dir=config
+                                        ['workbook_cache_dir'])
+            decision_store.add_from_df(corrected_df, overwrite=False)
+
+        # Choices made in a session that was stopped part way through
+        journal = DecisionJournal(in_path(assist['journal_file']))
+        journal_df = journal.replay()
+        if len(journal_df):
+            print(f"Resuming: {len(journal_df)} values were chosen in the "
+                  "last session before it stopped.")
+            decision_store.add_from_df(journal_df)
+        # Values chosen in the last session or in this one, which are not
+        # asked again even if they are under review
+        answered = set(zip(journal_df.column_name, journal_df.column_value))
+        review_dimension = assist.get('review_dimension')
+        review_value = assist.get('review_value')
+        how_decided = {"reused": 0, "automatic": 0, "asked": 0}
+
+        # The best matches of each value, best first
+        matches_dict = {
+            key: list(zip(group.sdmx_name, group.score))
+            for key, group in (suggestions_df
+                               .sort_values("rank")
+                               .groupby(["column_name", "column_value"]))}
+
+        all_records = val_col_pairs_df.shape[0]
+        for i, row in enumerate(val_col_pairs_df.iterrows()):
+            print(f"Progress: {(i/all_records)*100:.2f}%")
+            index_number = row[0]
+            column_name = row[1].column_name
+            column_value = row[1].column_value
+            possible_matches = matches_dict.get((column_name, column_value),
+                                                [])
+            code_name_dict = dsd_code_name_list_dict.get(column_name, {})
+
+            decision = decision_store.get(column_name, column_value)
+            if decision and (column_name, column_value) in answered:
+                how_decided["reused"] += 1
+            elif _under_review(column_name, column_value,
+                               review_dimension, review_value):
+                # Values under review are always asked again
+                if decision:
+                    print(f"Current code: {decision[0]} ({decision[1]})")
+                decision = None
+            # A remembered code is only used if it is still in the codelist
+            elif decision and (decision[0] == "None"
+                               or decision[0] in code_name_dict.values()):
+                how_decided["reused"] += 1
+            else:
+                decision = auto_decision(column_value,
+                                         possible_matches,
+                                         code_name_dict,
+                                         assist['auto_accept_score'],
+                                         assist['min_score_margin'])
+                if decision:
+                    how_decided["automatic"] += 1
+            if decision:
+                sdmx_code, comments = decision
+            else:
+                how_decided["asked"] += 1
+                try:
+                    sdmx_code, comments = (suggest_dsd_value
+                                           (column_value,
+                                            possible_matches,
+                                            code_name_dict))
+                except (KeyboardInterrupt, EOFError):
+                    print("\nStopped. The values chosen so far are kept in "
+                          f"{journal.path}; run again to carry on.")
+                    raise
+                journal.append(column_name, column_value,
+                               sdmx_code, comments)
+                decision_store.record(column_name, column_value,
+                                      sdmx_code, comments)
+                answered.add((column_name, column_value))
+                print(f"\nCorresponding code: {sdmx_code}\n")
+            code_comments_dict["index_code"].append(index_number)
+            code_comments_dict["sdmx_code"].append(f"'{sdmx_code}'")
+            code_comments_dict["comments"].append(comments)
+
+        decision_store.save()
+        journal.remove()
+        print(f"{how_decided['reused']} values used earlier decisions, "
+              f"{how_decided['automatic']} were matched automatically and "
+              f"{how_decided['asked']} were chosen manually.")
+
+        match_values_df = (pd.DataFrame
+                           .from_dict(code_comments_dict)
+                           .set_index("index_code"))
+
+        match_values_df.rename(columns={"index_code": "index"}, inplace=True)
+
+        val_col_pairs_df = (val_col_pairs_df
+                            .drop(['sdmx_code', 'comments'], axis=1)
+                            .join(match_values_df))
+
+        print(val_col_pairs_df.sample(min(20, len(val_col_pairs_df))))
+
+    if ctx.intermediate_outputs:
+        # The Excel file is for manual correction, the other copy is for
+        # quality checks
+        manual_chosen_vals_out_path = (ctx.out_path
+                                       (config['manual_names_to_codes']))
+        ctx.writer.write_excel(val_col_pairs_df, manual_chosen_vals_out_path)
+        ctx.writer.write_intermediate(val_col_pairs_df,
+                                      config['manual_names_to_codes_csv'],
+                                      quotechar="'")
+
+    return {"chosen_values_df": val_col_pairs_df}
+
+
+def map_codes(ctx: RunContext, dsd_index):
+    """Stage: writes the code (disaggregation value) mapping from the
+        manually corrected choices of SDMX codes."""
+    config = ctx.config
+
+    # Code Mapping in correct format as reuired for SDMX
+    WANTED_COLS_CODE_MAPPING = ["column_value", "column_name", "sdmx_code"]
+    code_mapping_df = (manual_excel
+                       (config['manual_chosen_codes_out_path'],
+                        WANTED_COLS_CODE_MAPPING,
+                        cache_dir=config['workbook_cache_dir']))
+
+    # The concept names need mapping to the concept IDs which come from
+    # the DSD
+    concept_id_index = LookupIndex.from_dict(dsd_index.concept_ids())
+    # Create the Dimension column as required for SDMX
+    code_mapping_df = v_lookup(code_mapping_df, "column_name",
+                               concept_id_index, new_column="Dimension")
+    # column_name was only needed for mapping - dropping it now
+    code_mapping_df.drop("column_name", axis=1, inplace=True)
+    code_mapping_df.rename(columns={'sdmx_code': "Value",
+                                    'column_value': 'Text'},
                            inplace=True)
-concept_id_names_mapping_dict = (concept_id_names_df
-                                 .set_index("concept_name")
-                                 .to_dict()['concept_id'])
-# Create the Dimension column as required for SDMX
-code_mapping_df['Dimension'] = (code_mapping_df
-                                   .column_name
-                                   .map(concept_id_names_mapping_dict))
-# column_name was only needed for mapping - dropping it now
-code_mapping_df.drop("column_name", axis=1, inplace=True)
-code_mapping_df.rename(columns={'sdmx_code': "Value",
-                                'column_value': 'Text'},
-                       inplace=True)
-# Reorder the columns as required
-ORDER_CODE_MAPPING = ['Text', 'Dimension', 'Value']
-code_mapping_df = code_mapping_df[ORDER_CODE_MAPPING]
-# Drop empty rows
-code_mapping_df.dropna(subset=["Value", "Text"], axis='index', inplace=True)
-# Write disaggregation code mapping out to csv
-code_map_out_path = out_path(config['code_mapping_out_file'])
-code_mapping_df.to_csv(code_map_out_path, sep="\t", index=False)
-
-
-# Column (disaggregation name) mapping in correct format for SDMX
-WANTED_COLS_COL_MAPPING = ["sdg_column_name", "SDMX_Concept_ID"]
-# Using the ExceFile object which is the manual chosen mapping
-# for SDG column names to SDMX concepts
-column_mapping_df = manual_excel(SDG_SDMX_MANUAL_EXCEL_FILE,
-                                 WANTED_COLS_COL_MAPPING)
-# Drop empty rows
-column_mapping_df.dropna(subset=["SDMX_Concept_ID"],
-                         axis='index',
-                         inplace=True)
-# Rename column headers as required for SDMX
-column_mapping_df.rename(columns={"sdg_column_name": "Text",
-                         "SDMX_Concept_ID": "Value"},
-                         inplace=True)
-# Write SDMX formatted disaggregation names out to csv
-column_mapping_out_path = out_path(config['column_mapping_out_file'])
-column_mapping_df.to_csv(column_mapping_out_path, sep="\t", index=False
+    # Reorder the columns as required
+    ORDER_CODE_MAPPING = ['Text', 'Dimension', 'Value']
+    code_mapping_df = code_mapping_df[ORDER_CODE_MAPPING]
+    # Drop empty rows
+    code_mapping_df = code_mapping_df.dropna(subset=["Value", "Text"],
+                                             axis='index')
+    # Write disaggregation code mapping out to csv
+    code_map_out_path = ctx.out_path(config['code_mapping_out_file'])
+    ctx.writer.write_table(code_mapping_df, code_map_out_path)
+
+    return {"code_mapping_df": code_mapping_df}
+
+
+def validate_mappings(ctx: RunContext, code_mapping_df: pd.DataFrame,
+                      column_mapping_df: pd.DataFrame, dsd_index):
+    """Stage: checks that every code in the code mapping is in the
+        codelist of its dimension and every concept in the concept mapping
+        is in the DSD, and reports any problems."""
+    from validation import validate_mappings as validate
+
+    validation_config = ctx.config['validation']
+    if not validation_config['enabled']:
+        print("Validation of the mappings is switched off")
+        return {"validation_df": None}
+
+    validation_df = validate(code_mapping_df, column_mapping_df, dsd_index)
+    ctx.writer.write_table(validation_df,
+                           ctx.out_path(validation_config['report_file']),
+                           sep=",")
+    if len(validation_df):
+        print(f"{len(validation_df)} problems were found in the mappings. "
+              f"See {ctx.out_path(validation_config['report_file'])}")
+        print(validation_df
+              .groupby(["mapping", "issue"]).size()
+              .to_string())
+        if validation_config['fail_on_problems']:
+            raise ValueError("The mappings did not pass validation")
+    else:
+        print("The mappings passed validation")
+    return {"validation_df": validation_df}
+
+
+def export_data(ctx: RunContext, inc_df: pd.DataFrame,
+                column_mapping_df: pd.DataFrame,
+                code_mapping_df: pd.DataFrame):
+    """Stage: if switched on, fetches the data of every selected indicator,
+        maps its disaggregations to SDMX concepts and codes and writes it
+        as SDMX-CSV, one indicator per process."""
+    from export import ExportResult, combine, export_indicators
+
+    export_config = ctx.config['export']
+    if not export_config['enabled']:
+        print("Exporting the data as SDMX-CSV is switched off")
+        return {"export_df": None}
+
+    results = export_indicators(ctx.config, list(inc_df.index),
+                                column_mapping_df, code_mapping_df,
+                                ctx.out_path(export_config['out_dir']),
+                                max_workers=export_config['max_workers'])
+    export_df = pd.DataFrame(results, columns=ExportResult._fields)
+    for result in results:
+        if result.error:
+            print(f"Could not export {result.indicator}: {result.error}")
+        elif result.unmapped_columns and ctx.verbose:
+            print(f"{result.indicator}: {result.dropped_unmapped_columns} "
+                  "rows were dropped as these columns have no SDMX concept "
+                  f"{result.unmapped_columns}")
+    combined_path = ctx.out_path(export_config['combined_file'])
+    rows = combine(results, combined_path, export_config['total_code'])
+    print(f"{rows} observations of {export_df.path.notna().sum()} "
+          f"indicators were written to {combined_path}")
+    ctx.writer.write_table(export_df.drop(columns=["columns"]),
+                           ctx.out_path(export_config['report_file']),
+                           sep=",")
+    return {"export_df": export_df}
+
+
+def _published_path(ctx: RunContext, out_file_key):
+    "The path of the published copy of a mapping output"
+    return os.path.join(ctx.out_path(ctx.config['delta']['published_dir']),
+                        ctx.config[out_file_key])
+
+
+def diff_mappings(ctx: RunContext, column_mapping_df: pd.DataFrame,
+                  code_mapping_df: pd.DataFrame):
+    """Stage: in delta mode, compares the code and concept mappings with
+        the last published ones and writes only the rows that have been
+        added, removed or changed, with a summary."""
+    from delta import diff_mapping, read_published, summarise
+
+    config = ctx.config
+    delta_config = config['delta']
+    if not delta_config['enabled']:
+        print("Delta mode is switched off")
+        return {"code_mapping_delta_df": None,
+                "concept_mapping_delta_df": None,
+                "delta_summary_df": None}
+
+    # Code mappings are identified by the SDG value and the SDMX
+    # dimension, concept mappings by the SDG disaggregation name
+    code_mapping_delta_df = diff_mapping(
+        read_published(_published_path(ctx, 'code_mapping_out_file'),
+                       ["Text", "Dimension", "Value"]),
+        code_mapping_df, keys=["Text", "Dimension"], value_cols=["Value"])
+    concept_mapping_delta_df = diff_mapping(
+        read_published(_published_path(ctx, 'column_mapping_out_file'),
+                       ["Text", "Value"]),
+        column_mapping_df, keys=["Text"], value_cols=["Value"])
+
+    summaries = {
+        "code_mapping": summarise(code_mapping_delta_df,
+                                  len(code_mapping_df)),
+        "concept_mapping": summarise(concept_mapping_delta_df,
+                                     len(column_mapping_df))}
+    delta_summary_df = (pd.DataFrame.from_dict(summaries, orient="index")
+                        .rename_axis("mapping"))
+    print("Changes since the mappings were last published")
+    print(delta_summary_df.to_string())
+
+    ctx.writer.write_table(code_mapping_delta_df,
+                           ctx.out_path(delta_config['code_mapping_file']))
+    ctx.writer.write_table(concept_mapping_delta_df,
+                           ctx.out_path(delta_config
+                                        ['concept_mapping_file']))
+    ctx.writer.write_table(delta_summary_df.reset_index(),
+                           ctx.out_path(delta_config['summary_file']))
+
+    return {"code_mapping_delta_df": code_mapping_delta_df,
+            "concept_mapping_delta_df": concept_mapping_delta_df,
+            "delta_summary_df": delta_summary_df}
+
+
+def publish_mappings(ctx: RunContext):
+    """Copies the code and concept mappings of this run to the published
+        folder, for the next run in delta mode to be compared against"""
+    from delta import publish
+
+    published_dir = ctx.out_path(ctx.config['delta']['published_dir'])
+    publish([ctx.out_path(ctx.config['code_mapping_out_file']),
+             ctx.out_path(ctx.config['column_mapping_out_file'])],
+            published_dir)
+    print(f"The mappings have been published to {published_dir}")
+
+
+def _metadata_sources(ctx: RunContext):
+    return [ctx.http_cache.fetch(ctx.config['meta_url']),
+            ctx.http_cache.fetch(ctx.config['disag_url'])]
+
+
+def _value_sources(ctx: RunContext):
+    """The manually updated Excel file and the csv of values of each
+        disaggregation it maps. Values that cannot be fetched are left out
+        here; collect_values reports them."""
+    from fetching import fetch_many
+
+    mapped_columns_df = get_mapped_columns(ctx.config)
+    fetch_config = ctx.config['fetch']
+    results = fetch_many(mapped_columns_df.disag_val_urls,
+                         ctx.http_cache.fetch,
+                         max_workers=fetch_config['max_workers'],
+                         retries=fetch_config['retries'],
+                         backoff=fetch_config['backoff_seconds'])
+    return ([in_path(ctx.config["manual_excel_file_name"])]
+            + [result.value for result in results if result.error is None])
+
+
+def _export_report(ctx: RunContext):
+    """The export report of the last run, which lists the indicators that
+        were exported, or None if there is none. If the indicators chosen
+        change, the stage is run again anyway, as its inputs change."""
+    report_path = ctx.out_path(ctx.config['export']['report_file'])
+    if not os.path.exists(report_path):
+        return None
+    return pd.read_csv(report_path, dtype=str)
+
+
+def _export_sources(ctx: RunContext):
+    """The data csv of each indicator that was exported, so the export is
+        run again when the data are refreshed. Data that cannot be fetched
+        are left out here; export_data reports them."""
+    from export import data_url
+    from fetching import fetch_many
+
+    export_config = ctx.config['export']
+    report_df = _export_report(ctx) if export_config['enabled'] else None
+    if report_df is None:
+        return []
+    fetch_config = ctx.config['fetch']
+    results = fetch_many([data_url(export_config, indicator_id)
+                          for indicator_id in report_df.indicator],
+                         ctx.http_cache.fetch,
+                         max_workers=fetch_config['max_workers'],
+                         retries=fetch_config['retries'],
+                         backoff=fetch_config['backoff_seconds'])
+    return [result.value for result in results if result.error is None]
+
+
+def _export_writes(ctx: RunContext):
+    """The combined SDMX-CSV file, the export report and the file of each
+        indicator that was exported"""
+    from export import indicator_path
+
+    export_config = ctx.config['export']
+    if not export_config['enabled']:
+        return []
+    report_df = _export_report(ctx)
+    out_dir = ctx.out_path(export_config['out_dir'])
+    written = ([] if report_df is None
+               else [indicator_path(out_dir, indicator_id)
+                     for indicator_id in report_df.indicator[
+                         report_df.path.notna()]])
+    return [ctx.out_path(export_config['combined_file']),
+            ctx.out_path(export_config['report_file']),
+            *written]
+
+
+def _dsd_sources(ctx: RunContext):
+    return [ctx.http_cache.fetch(ctx.config['dsd_url'])]
+
+
+def _concept_sources(ctx: RunContext):
+    return [in_path(ctx.config["manual_excel_file_name"])]
+
+
+def _decision_sources(ctx: RunContext):
+    """The remembered decisions and the manually corrected choices, which
+        are only read when the code mapping is chosen manually"""
+    if not ctx.config['manually_choose_code_mapping']:
+        return []
+    paths = [in_path(ctx.config['manual_chosen_codes_out_path']),
+             in_path(ctx.config['code_mapping_assist']['decisions_file'])]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _corrected_codes_sources(ctx: RunContext):
+    return [in_path(ctx.config['manual_chosen_codes_out_path'])]
+
+
+def _recall_sources(ctx: RunContext):
+    "The manually corrected choices, if the shortlist recall is checked"
+    if not ctx.config['fuzzy_match']['blocking']['check_recall']:
+        return []
+    return [in_path(ctx.config['manual_chosen_codes_out_path'])]
+
+
+def _published_sources(ctx: RunContext):
+    "The published mappings, once there are any"
+    if not ctx.config['delta']['enabled']:
+        return []
+    paths = [_published_path(ctx, 'code_mapping_out_file'),
+             _published_path(ctx, 'column_mapping_out_file')]
+    return [path for path in paths if os.path.exists(path)]
+
+
+def _delta_writes(ctx: RunContext):
+    delta_config = ctx.config['delta']
+    if not delta_config['enabled']:
+        return []
+    return [ctx.out_path(delta_config[key])
+            for key in ("code_mapping_file", "concept_mapping_file",
+                        "summary_file")]
+
+
+# The config keys that decide what is written out by every stage
+OUTPUT_CONFIG_KEYS = ("intermediate_outputs_needed", "output_writers")
+
+# The stages of the pipeline in the order they are run. Each stage is run
+# with the outputs it requires from the earlier stages.
+STAGES = [
+    Stage("load_metadata", load_metadata, (),
+          ("meta_data_df", "disag_report_df"),
+          config_keys=("meta_url", "required_cols", "proxy_terms",
+                       "disag_url", "geo_disag_terms",
+                       "required_disag_cols", "uk_terms", "sort_order",
+                       "case_sensitive_terms",
+                       "meta_outfile", *OUTPUT_CONFIG_KEYS),
+          sources=_metadata_sources),
+    Stage("select_indicators", select_indicators,
+          ("meta_data_df", "disag_report_df"),
+          ("inc_df", "unique_disags", "selection_report_df"),
+          config_keys=("suitability_test", "2020indicators",
+                       "sdg_cols_outfile", *OUTPUT_CONFIG_KEYS)),
+    Stage("collect_values", collect_values, (), ("val_col_pairs_df",),
+          config_keys=("manual_excel_file_name", "URL_prefix",
+                       "URL_suffix", "val_col_file", "matched_values_file",
+                       *OUTPUT_CONFIG_KEYS),
+          sources=_value_sources),
+    Stage("load_dsd", load_dsd, (), ("dsd_path", "dsd_index"),
+          config_keys=("dsd_url", "dsd_cache_dir"),
+          sources=_dsd_sources),
+    Stage("map_concepts", map_concepts, ("val_col_pairs_df", "dsd_index"),
+          ("dsd_code_name_list_dict", "column_mapping_df"),
+          config_keys=("manual_excel_file_name", "column_mapping_out_file"),
+          sources=_concept_sources,
+          writes=lambda ctx: [ctx.out_path(ctx.config
+                                           ['column_mapping_out_file'])]),
+    Stage("match_values", match_values,
+          ("val_col_pairs_df", "dsd_code_name_list_dict"),
+          ("suggestions_df",),
+          config_keys=("fuzzy_match", "manual_chosen_codes_out_path"),
+          sources=_recall_sources,
+          writes=lambda ctx: [ctx.out_path(ctx.config['fuzzy_match']
+                                           ['suggestions_file'])]),
+    Stage("suggest_codes", suggest_codes,
+          ("val_col_pairs_df", "dsd_code_name_list_dict", "suggestions_df"),
+          ("chosen_values_df",),
+          sources=_decision_sources,
+          config_keys=("manually_choose_code_mapping", "code_mapping_assist",
+                       "manual_chosen_codes_out_path",
+                       "manual_names_to_codes", "manual_names_to_codes_csv",
+                       *OUTPUT_CONFIG_KEYS),
+          # It may ask the user to choose codes, so it runs on its own
+          exclusive=True),
+    Stage("map_codes", map_codes, ("dsd_index",), ("code_mapping_df",),
+          config_keys=("code_mapping_out_file",
+                       "manual_chosen_codes_out_path"),
+          sources=_corrected_codes_sources,
+          writes=lambda ctx: [ctx.out_path(ctx.config
+                                           ['code_mapping_out_file'])]),
+    Stage("validate_mappings", validate_mappings,
+          ("code_mapping_df", "column_mapping_df", "dsd_index"),
+          ("validation_df",),
+          config_keys=("validation",),
+          writes=lambda ctx: ([ctx.out_path(ctx.config['validation']
+                                            ['report_file'])]
+                              if ctx.config['validation']['enabled']
+                              else [])),
+    Stage("export_data", export_data,
+          ("inc_df", "column_mapping_df", "code_mapping_df"),
+          ("export_df",),
+          config_keys=("export",),
+          sources=_export_sources,
+          writes=_export_writes),
+    Stage("diff_mappings", diff_mappings,
+          ("column_mapping_df", "code_mapping_df"),
+          ("code_mapping_delta_df", "concept_mapping_delta_df",
+           "delta_summary_df"),
+          config_keys=("delta", "code_mapping_out_file",
+                       "column_mapping_out_file"),
+          sources=_published_sources,
+          writes=_delta_writes),
+]
+
+
+def print_fetch_summary(http_cache):
+    "Prints how the remote files read in this run were served"
+    for source, totals in http_cache.summary().items():
+        print(f"{source}: {totals['requests']} requests, "
+              f"{totals['bytes'] / 1024:.0f} KB, "
+              f"{totals['seconds']:.2f}s")
+
+
+def print_schedule(schedule: dict):
+    "Prints the critical path of the run and how long the run took"
+    path = " -> ".join(f"{stage['stage']} ({stage['seconds']:.2f}s)"
+                       for stage in schedule['critical_path'])
+    print(f"Critical path: {path or 'all stages skipped'}")
+    print(f"The critical path took {schedule['critical_path_seconds']:.2f}s "
+          f"and the run {schedule['wall_seconds']:.2f}s; the stages took "
+          f"{schedule['stage_seconds']:.2f}s between them.")
+
+
+def run_batch_mode(config: dict, selected: list):
+    "Runs the selected stages for every platform and prints the results"
+    from batch import run_batch
+
+    results = run_batch(config, selected,
+                        max_workers=(config.get('batch') or {})
+                        .get('max_workers'))
+    for result in results:
+        if result.error:
+            print(f"{result.name}: failed, {result.error}. "
+                  f"See {os.path.join(result.output_dir, 'run.log')}")
+        else:
+            print(f"{result.name}: outputs written to {result.output_dir} "
+                  f"{result.rows}")
+    return results
+
+
+def parse_args(argv=None):
+    "Parses the command line arguments"
+    stage_names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(
+        description="Selects SDG indicators suitable for SDMX and maps "
+                    "their disaggregations to SDMX concepts and codes.")
+    parser.add_argument("--config", default="config.yml",
+                        help="path to the config file")
+    parser.add_argument("--stage", choices=stage_names,
+                        help="run only this stage (and any stages "
+                             "whose outputs it needs)")
+    parser.add_argument("--from", dest="start", choices=stage_names,
+                        help="first stage to run")
+    parser.add_argument("--to", dest="end", choices=stage_names,
+                        help="last stage to run")
+    parser.add_argument("--offline", action="store_true",
+                        help="only read remote files from the cache")
+    parser.add_argument("--force", action="store_true",
+                        help="run the chosen stages even if their inputs "
+                             "have not changed")
+    parser.add_argument("--review", metavar="DIMENSION",
+                        help="choose the SDMX codes of the values of this "
+                             "SDMX concept (e.g. Sex) again")
+    parser.add_argument("--review-value", metavar="VALUE",
+                        help="choose the SDMX code of this SDG value again")
+    parser.add_argument("--report", metavar="PATH",
+                        help="write a json report of the time, memory, "
+                             "downloads and rows of each stage")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile each stage with cProfile (implies "
+                             "--report)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="trace the memory allocated by each stage "
+                             "with tracemalloc (implies --report)")
+    parser.add_argument("--export", action="store_true",
+                        help="write the data of every selected indicator as "
+                             "SDMX-CSV, using the code and concept mappings")
+    parser.add_argument("--delta", action="store_true",
+                        help="write only the rows of the mappings that have "
+                             "changed since they were last published")
+    parser.add_argument("--publish", action="store_true",
+                        help="after the run, publish the code and concept "
+                             "mappings for later runs with --delta to be "
+                             "compared against")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="run up to N stages at once (1 runs them one "
+                             "after another)")
+    parser.add_argument("--batch", action="store_true",
+                        help="run the chosen stages for every platform in "
+                             "the platforms list of the config, in parallel")
+    parser.add_argument("--list", action="store_true",
+                        help="list the stages and exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        for stage in STAGES:
+            print(stage.name)
+        return
+
+    config = load_config(args.config)
+    if args.offline:
+        config['http_cache'] = {**(config.get('http_cache') or {}),
+                                'offline': True}
+    if args.review or args.review_value:
+        # Reviewing means choosing codes manually, for the chosen values
+        config['manually_choose_code_mapping'] = True
+        config['code_mapping_assist'] = {**config['code_mapping_assist'],
+                                         'review_dimension': args.review,
+                                         'review_value': args.review_value}
+    if args.report or args.profile or args.trace_memory:
+        instrumentation = {**(config.get('instrumentation') or {}),
+                           'enabled': True}
+        if args.report:
+            instrumentation['report_file'] = os.path.abspath(args.report)
+        if args.profile:
+            instrumentation['profile'] = True
+        if args.trace_memory:
+            instrumentation['trace_memory'] = True
+        config['instrumentation'] = instrumentation
+    if args.workers:
+        config['scheduler'] = {**config['scheduler'],
+                               'max_workers': args.workers}
+    if args.export:
+        config['export'] = {**config['export'], 'enabled': True}
+    if args.delta:
+        config['delta'] = {**config['delta'], 'enabled': True}
+
+    start, end = args.start, args.end
+    if args.stage:
+        start = end = args.stage
+    selected = select_stages(STAGES, start, end)
+    if args.batch:
+        return run_batch_mode(config, selected)
+    store = ArtifactStore.from_config(config)
+    ctx = RunContext(config)
+    recorder = StageRecorder.from_config(config, report_dir=ctx.output_dir)
+    timings = {}
+    run_start = time.perf_counter()
+    state = run_stages(STAGES, ctx, selected, store=store, force=args.force,
+                       recorder=recorder,
+                       max_workers=config['scheduler']['max_workers'],
+                       timings=timings)
+    schedule = schedule_summary(STAGES, timings,
+                                time.perf_counter() - run_start)
+    print_schedule(schedule)
+    if args.publish:
+        publish_mappings(ctx)
+    if ctx.verbose:
+        print_fetch_summary(ctx.http_cache)
+    if recorder is not None:
+        recorder.schedule = schedule
+        recorder.write(ctx.http_cache.summary())
+        if ctx.verbose:
+            recorder.print_summary()
+        print(f"Run report written to {recorder.report_path}")
+    return state
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+
+import pandas as pd
+
+from indicators import is_archived
+
+# How much of the file is read at a time
+CHUNK_SIZE = 1024 * 1024
+# Text columns with fewer distinct values than this share of their rows
+# are kept as categories
+CATEGORY_SHARE = 0.5
+
+
+class _ObjectStream:
+    """Reads the members of the top level object of a json file one at a
+        time, reading the file a chunk at a time, so only one member is
+        ever decoded and held in memory at once.
+
+    Args:
+        json_file (file): the open json file
+        chunk_size (int): how many characters are read at a time
+    """
+
+    def __init__(self, json_file, chunk_size=CHUNK_SIZE):
+        self._file = json_file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        "Reads the next chunk, dropping what has already been decoded"
+        chunk = self._file.read(self._chunk_size)
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+
+    def _next_char(self):
+        "Gets the next character that is not whitespace, without using it"
+        while True:
+            while (self._pos < len(self._buffer)
+                   and self._buffer[self._pos].isspace()):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError("The json file ended unexpectedly")
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the json file "
+                             f"but found {char!r}")
+        self._pos += 1
+        return char
+
+    def _decode(self):
+        """Decodes the next json value, reading more of the file until
+            all of it has been read"""
+        self._next_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer,
+                                                      self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def members(self):
+        "Yields the (key, value) of each member of the top level object"
+        self._fill()
+        self._expect("{")
+        if self._next_char() == "}":
+            return
+        while True:
+            key = self._decode()
+            self._expect(":")
+            yield key, self._decode()
+            if self._expect(",}") == "}":
+                return
+
+
+def _compact(df: pd.DataFrame) -> pd.DataFrame:
+    """Makes text columns that repeat the same few values (e.g.
+        reporting_status) into categories"""
+    categories = {}
+    for col in df.columns:
+        values = df[col].dropna()
+        if (len(values)
+                and pd.api.types.infer_dtype(values) == "string"
+                and values.nunique() < CATEGORY_SHARE * len(values)):
+            categories[col] = "category"
+    return df.astype(categories)
+
+
+def read_metadata(path, fields: list, skip_archived=True,
+                  chunk_size=CHUNK_SIZE) -> pd.DataFrame:
+    """Reads the meta data of every indicator from an Open SDG all.json,
+        which is an object of indicator id --> meta data fields. The file
+        is read one indicator at a time and only the wanted fields of each
+        are kept, so long fields that are not needed (such as the HTML
+        text of each page) are never all in memory at once.
+
+    Args:
+        path (str): path of the all.json file
+        fields (list): the meta data fields to keep, e.g. the
+            required_cols from the config. An indicator without a field
+            gets NaN.
+        skip_archived (bool): if True, archived indicators are left out
+        chunk_size (int): how many characters are read at a time
+
+    Returns:
+        pd.DataFrame: the fields of each indicator, with the indicator ids
+            as the index, and repetitive text columns as categories
+    """
+    ids = []
+    rows = []
+    with open(path, encoding="utf-8") as json_file:
+        for indicator_id, indicator_meta in (_ObjectStream(json_file,
+                                                           chunk_size)
+                                             .members()):
+            if skip_archived and is_archived(indicator_id):
+                continue
+            if not isinstance(indicator_meta, dict):
+                indicator_meta = {}
+            ids.append(indicator_id)
+            rows.append([indicator_meta.get(field) for field in fields])
+    meta_data_df = pd.DataFrame(rows, index=pd.Index(ids, dtype=object),
+                                columns=fields)
+    return _compact(meta_data_df)
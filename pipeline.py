@@ -0,0 +1,274 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+import yaml
+
+# A stage of the pipeline. func is called with the RunContext and the
+# outputs of earlier stages named in requires, and returns a dictionary
+# of the outputs named in provides.
+# config_keys are the config keys the stage reads. sources, if given, is
+# called with the RunContext and returns the paths of the files the stage
+# reads, and writes returns the paths of the files it writes. These are
+# used to decide if the stored outputs of the stage can be used instead
+# of running it.
+# An exclusive stage, such as one that asks the user questions, is never
+# run at the same time as another stage.
+Stage = namedtuple("Stage",
+                   ["name", "func", "requires", "provides",
+                    "config_keys", "sources", "writes", "exclusive"],
+                   defaults=((), None, None, False))
+
+# The name of the stage being run, in the thread that runs it, so what the
+# stage does (such as its downloads) can be put down to it
+current_stage = ContextVar("current_stage", default=None)
+
+
+def load_config(config_path='config.yml'):
+    "Loads the yaml config file"
+    with open(config_path) as config_file:
+        return yaml.safe_load(config_file)
+
+
+class RunContext:
+    """Holds what is shared by all stages of a run: the config, the
+        cache through which remote files are read and the writer of the
+        output files. These are only created when a stage first needs
+        them.
+
+    Args:
+        config (dict): the loaded config file
+    """
+
+    def __init__(self, config: dict):
+        self.config = config
+        self.verbose = config['verbose']
+        self.intermediate_outputs = config['intermediate_outputs_needed']
+        self.output_dir = config.get('output_dir', 'outputs')
+        self._http_cache = None
+        self._writer = None
+        # Stages may be run at the same time, so the shared resources are
+        # made under a lock
+        self._lock = threading.Lock()
+
+    def out_path(self, file_name):
+        "Creates a file path for output files"
+        return os.path.join(self.output_dir, file_name)
+
+    @property
+    def http_cache(self):
+        with self._lock:
+            if self._http_cache is None:
+                from fetching import HTTPCache
+                self._http_cache = HTTPCache.from_config(self.config)
+            return self._http_cache
+
+    @property
+    def writer(self):
+        with self._lock:
+            if self._writer is None:
+                from writers import OutputWriter
+                self._writer = OutputWriter.from_config(self.config,
+                                                        self.output_dir)
+            return self._writer
+
+    @property
+    def fetch_stats(self) -> list:
+        "How each request for a remote file has been served in this run"
+        return self._http_cache.stats if self._http_cache else []
+
+
+def select_stages(stages: list, start=None, end=None) -> list:
+    """Gets the stages from start to end (inclusive) by name. If start or
+        end are not given the range is open at that end.
+
+    Args:
+        stages (list): all the stages of the pipeline, in order
+        start (str): name of the first stage to run
+        end (str): name of the last stage to run
+
+    Raises:
+        ValueError: if start or end is not the name of a stage
+
+    Returns:
+        list: the selected stages, in order
+    """
+    names = [stage.name for stage in stages]
+    for name in (start, end):
+        if name is not None and name not in names:
+            raise ValueError(f"There is no stage called {name}. "
+                             f"Choose from {', '.join(names)}")
+    start_index = names.index(start) if start else 0
+    end_index = names.index(end) if end else len(names) - 1
+    return stages[start_index:end_index + 1]
+
+
+class StageRunner:
+    """Runs single stages of the pipeline, for run_stages and the
+        concurrent scheduler: it decides if a stage's stored outputs can be
+        used, runs it if not, measures and stores its outputs, and records
+        when it started and finished.
+
+    Args:
+        stages (list): all the stages of the pipeline, in order
+        ctx (RunContext): the config and resources of this run
+        store (ArtifactStore): where the outputs of stages are stored.
+            If None, every stage is run.
+        recorder (StageRecorder): if given, records the time, memory,
+            downloads and rows of each stage
+    """
+
+    def __init__(self, stages: list, ctx: RunContext, store=None,
+                 recorder=None):
+        self.stages = stages
+        self.ctx = ctx
+        self.store = store
+        self.recorder = recorder
+        self.providers = {output: stage
+                          for stage in stages
+                          for output in stage.provides}
+        # When each stage that was run started and finished
+        self.timings = {}
+        self._keys = {}
+        # How long getting and hashing the sources of each stage took
+        self._key_seconds = {}
+        # A lock for the key of each stage, so it is only worked out once
+        # even if several threads need it
+        self._key_locks = {stage.name: threading.Lock() for stage in stages}
+
+    def stage_key(self, stage):
+        with self._key_locks[stage.name]:
+            if stage.name not in self._keys:
+                upstream_keys = {name: self.stage_key(self.providers[name])
+                                 for name in stage.requires}
+                # The sources are downloaded here, before the stage runs,
+                # so the downloads are counted against the stage
+                token = current_stage.set(stage.name)
+                start = time.perf_counter()
+                try:
+                    self._keys[stage.name] = self.store.stage_key(
+                        self.ctx, stage, upstream_keys)
+                finally:
+                    current_stage.reset(token)
+                self._key_seconds[stage.name] = time.perf_counter() - start
+            return self._keys[stage.name]
+
+    def stored_outputs(self, stage):
+        "Gets the stored outputs of a stage if they can be used"
+        outputs = self.store.load(stage.name, self.stage_key(stage))
+        if outputs is None:
+            return None
+        written = stage.writes(self.ctx) if stage.writes else []
+        if not all(os.path.exists(path) for path in written):
+            return None
+        return outputs
+
+    def run(self, stage, can_skip, get_inputs, gate=None) -> dict:
+        """Runs a stage, or gets its stored outputs.
+
+        Args:
+            stage (Stage): the stage
+            can_skip (bool): if True the stored outputs are used if they
+                can be
+            get_inputs (callable): takes the stage and returns its inputs,
+                running the stages that provide them if needed
+            gate (callable): if given, takes the stage and returns a
+                context that is held while the stage runs, to control
+                which stages run at the same time
+
+        Returns:
+            dict: the outputs of the stage
+        """
+        if self.store is not None and can_skip:
+            outputs = self.stored_outputs(stage)
+            if outputs is not None:
+                print(f"Skipping stage: {stage.name}, its inputs have "
+                      "not changed")
+                if self.recorder is not None:
+                    self.recorder.skipped(stage.name, outputs)
+                return outputs
+        inputs = get_inputs(stage)
+        with gate(stage) if gate else nullcontext():
+            print(f"Running stage: {stage.name}")
+            token = current_stage.set(stage.name)
+            start = time.perf_counter()
+            try:
+                if self.recorder is None:
+                    outputs = stage.func(self.ctx, **inputs)
+                else:
+                    with self.recorder.measure(self.ctx, stage.name,
+                                               inputs) as outputs:
+                        outputs.update(stage.func(self.ctx, **inputs))
+            finally:
+                current_stage.reset(token)
+            # The time spent downloading the stage's sources, while its
+            # key was worked out, is counted as part of the stage
+            self.timings[stage.name] = (
+                start - self._key_seconds.get(stage.name, 0.0),
+                time.perf_counter())
+        if self.store is not None:
+            self.store.save(stage.name, self.stage_key(stage), outputs)
+        return outputs
+
+
+def run_stages(stages: list, ctx: RunContext, selected: list,
+               state=None, store=None, force=False, recorder=None,
+               max_workers=1, timings=None) -> dict:
+    """Runs the selected stages in order. If a stage needs an output
+        that no earlier stage has made, the stage that provides it is
+        run first, so any single stage can be run on its own.
+
+        If an ArtifactStore is given, a stage whose inputs have not
+        changed since it was last run is skipped and its stored outputs
+        are used. The stages that provide its inputs are then only run
+        if they are needed by a stage that does have to run.
+
+        With max_workers more than 1, stages that do not depend on each
+        other are run at the same time (see scheduler.run_concurrently).
+
+    Args:
+        stages (list): all the stages of the pipeline, in order
+        ctx (RunContext): the config and resources of this run
+        selected (list): the stages to run
+        state (dict): outputs that are already available, by name
+        store (ArtifactStore): where the outputs of stages are stored.
+            If None, every stage is run.
+        force (bool): if True the selected stages are run even if their
+            stored outputs could be used
+        recorder (StageRecorder): if given, records the time, memory,
+            downloads and rows of each stage
+        max_workers (int): the most stages that are run at one time
+        timings (dict): if given, the (start, finish) time of each stage
+            that was run is put in it. The start is moved back by the time
+            its sources took to download and hash.
+
+    Returns:
+        dict: all the outputs made in the run, by name
+    """
+    state = {} if state is None else state
+    runner = StageRunner(stages, ctx, store, recorder)
+    if recorder is not None and recorder.trace_memory:
+        # tracemalloc has one peak for the whole process, so the peak of
+        # each stage can only be measured while it runs on its own
+        max_workers = 1
+    if max_workers > 1:
+        from scheduler import run_concurrently
+        run_concurrently(runner, selected, state, force, max_workers)
+    else:
+        def get_inputs(stage):
+            for name in stage.requires:
+                if name not in state:
+                    state.update(runner.run(runner.providers[name],
+                                            can_skip=True,
+                                            get_inputs=get_inputs))
+            return {name: state[name] for name in stage.requires}
+
+        for stage in selected:
+            state.update(runner.run(stage, can_skip=not force,
+                                    get_inputs=get_inputs))
+    if timings is not None:
+        timings.update(runner.timings)
+    return state
@@ -0,0 +1,175 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class StageGate:
+    """Controls which stages run at the same time: at most max_workers
+        stages run at once, and an exclusive stage only runs when no other
+        stage is running, and stops any other from starting until it has
+        finished.
+
+    Args:
+        max_workers (int): the most stages that run at one time
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._condition = threading.Condition()
+        self._running = 0
+        self._exclusive = False
+
+    def _can_start(self, exclusive):
+        if self._exclusive:
+            return False
+        if exclusive:
+            return self._running == 0
+        return self._running < self.max_workers
+
+    @contextmanager
+    def __call__(self, stage):
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._can_start(stage.exclusive))
+            self._running += 1
+            self._exclusive = stage.exclusive
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running -= 1
+                self._exclusive = False
+                self._condition.notify_all()
+
+
+def run_concurrently(runner, selected: list, state: dict, force=False,
+                     max_workers=4):
+    """Runs the selected stages, and the stages that provide their inputs,
+        as a graph: each stage starts as soon as the stages it needs
+        outputs from have finished, so stages that do not depend on each
+        other (e.g. downloading and parsing the DSD, and reading the meta
+        data and disaggregation values) overlap.
+
+        Each stage is run in its own thread, so a stage waiting for its
+        inputs never holds up another; a StageGate limits how many run at
+        once.
+
+    Args:
+        runner (StageRunner): runs each stage
+        selected (list): the stages to run
+        state (dict): outputs that are already available, by name. The
+            outputs of the stages are added to it.
+        force (bool): if True the selected stages are run even if their
+            stored outputs could be used
+        max_workers (int): the most stages that are run at one time
+
+    Raises:
+        Exception: the first error raised by a selected stage, in the
+            order of selected
+    """
+    gate = StageGate(max_workers)
+    lock = threading.Lock()
+    futures = {}
+    # A thread for every stage, so waiting for inputs cannot deadlock
+    executor = ThreadPoolExecutor(max_workers=len(runner.stages),
+                                  thread_name_prefix="stage")
+
+    def task(stage, can_skip):
+        outputs = runner.run(stage, can_skip, get_inputs, gate)
+        with lock:
+            state.update(outputs)
+
+    def ensure(stage, can_skip):
+        "Gets the future of a stage, starting it if it is not yet started"
+        with lock:
+            if stage.name not in futures:
+                futures[stage.name] = executor.submit(task, stage, can_skip)
+            return futures[stage.name]
+
+    def get_inputs(stage):
+        with lock:
+            needed = {runner.providers[name].name: runner.providers[name]
+                      for name in stage.requires if name not in state}
+        for future in [ensure(provider, can_skip=True)
+                       for provider in needed.values()]:
+            future.result()
+        return {name: state[name] for name in stage.requires}
+
+    with executor:
+        # The selected stages are all started before any of them can
+        # start a provider, so a selected stage is always run with
+        # can_skip=not force
+        with lock:
+            for stage in selected:
+                futures[stage.name] = executor.submit(task, stage,
+                                                      not force)
+        selected_futures = [futures[stage.name] for stage in selected]
+        for future in selected_futures:
+            future.result()
+
+
+def schedule_summary(stages: list, timings: dict, wall_seconds) -> dict:
+    """Sums up how the stages of a run were scheduled: the critical path,
+        the run time of all the stages added up and the wall time of the
+        run, for the run report
+
+    Args:
+        stages (list): all the stages of the pipeline
+        timings (dict): the (start, finish) time of each stage that was
+            run, from run_stages
+        wall_seconds (float): how long the run took
+    """
+    path, path_seconds = critical_path(stages, timings)
+    return {"wall_seconds": round(wall_seconds, 4),
+            "stage_seconds": round(sum(finish - start for start, finish
+                                       in timings.values()), 4),
+            "critical_path_seconds": round(path_seconds, 4),
+            "critical_path": [{"stage": name, "seconds": round(seconds, 4)}
+                              for name, seconds in path]}
+
+
+def critical_path(stages: list, timings: dict):
+    """Finds the critical path of a run: the chain of stages, each needing
+        the outputs of the one before, with the longest total run time.
+        However many stages run at once, a run cannot be faster than this.
+
+    Args:
+        stages (list): all the stages of the pipeline
+        timings (dict): the (start, finish) time of each stage that was
+            run, from run_stages
+
+    Returns:
+        (list, float): i) (stage name, seconds) of each stage on the path,
+                          first to last
+                       ii) the total seconds of the path
+    """
+    providers = {output: stage.name
+                 for stage in stages
+                 for output in stage.provides}
+    by_name = {stage.name: stage for stage in stages}
+    # The run time of the longest chain ending with each stage, and the
+    # stage before it in that chain
+    longest = {}
+
+    def chain(name):
+        if name not in longest:
+            start, finish = timings[name]
+            before = [providers[output]
+                      for output in by_name[name].requires
+                      if providers.get(output) in timings]
+            previous = max(before, key=lambda stage: chain(stage)[0],
+                           default=None)
+            earlier = chain(previous)[0] if previous else 0.0
+            longest[name] = (earlier + finish - start, previous)
+        return longest[name]
+
+    if not timings:
+        return [], 0.0
+    last = max(timings, key=lambda name: chain(name)[0])
+    total = chain(last)[0]
+    path = []
+    while last is not None:
+        start, finish = timings[last]
+        path.append((last, finish - start))
+        last = longest[last][1]
+    return path[::-1], total
@@ -0,0 +1,148 @@
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# One test of the suitability test: the column it tests, the operator and
+# the value it tests against.
+Criterion = namedtuple("Criterion", ["column", "op", "value"])
+
+# The operators that can be used in the suitability test. A plain value in
+# the config is tested for equality.
+OPERATORS = ("eq", "ne", "in", "not_in", "regex", "is_null")
+
+
+def compile_criteria(suitability_test: dict) -> list:
+    """Compiles the suitability test from the config into a list of
+        criteria. Each key is a column name and each value is either a
+        plain value, which the column must be equal to, or a dictionary of
+        operators and their values, e.g.
+
+            reporting_status: "complete"
+            national_geographical_coverage:
+              in: ["United Kingdom", "Great Britain"]
+            other_info:
+              is_null: true
+
+    Args:
+        suitability_test (dict): the suitability_test from the config
+
+    Raises:
+        ValueError: if an operator is not one of OPERATORS
+
+    Returns:
+        list: a Criterion for each test
+    """
+    criteria = []
+    for column, test in suitability_test.items():
+        if not isinstance(test, dict):
+            test = {"eq": test}
+        for op, value in test.items():
+            if op not in OPERATORS:
+                raise ValueError(f"Unknown operator '{op}' for {column} in "
+                                 f"suitability_test. Use one of {OPERATORS}")
+            if op in ("in", "not_in"):
+                value = tuple(value)
+            elif op == "regex":
+                value = re.compile(value)
+            criteria.append(Criterion(column, op, value))
+    return criteria
+
+
+def criterion_mask(df: pd.DataFrame, criterion: Criterion) -> np.ndarray:
+    """Tests a whole column of the dataframe against a criterion at once.
+
+    Raises:
+        KeyError: if the column of the criterion is not in the dataframe
+
+    Returns:
+        np.ndarray: boolean array, True for rows that pass the criterion
+    """
+    if criterion.column not in df.columns:
+        raise KeyError(f"The suitability_test column {criterion.column} "
+                       "is not in the meta data")
+    col = df[criterion.column]
+    op, value = criterion.op, criterion.value
+    if op == "eq":
+        mask = col.eq(value)
+    elif op == "ne":
+        mask = col.ne(value)
+    elif op == "in":
+        mask = col.isin(value)
+    elif op == "not_in":
+        mask = ~col.isin(value)
+    elif op == "regex":
+        mask = col.astype("string").str.contains(value, na=False)
+    else:
+        mask = col.isna() if value else col.notna()
+    return mask.to_numpy(dtype=bool, na_value=False)
+
+
+def select(df: pd.DataFrame, criteria: list, mask_cache=None):
+    """Selects the rows of a dataframe that pass every criterion. Each
+        criterion is tested on its whole column once, then the masks are
+        combined.
+
+    Args:
+        df (pd.DataFrame): the dataframe to select from, e.g. meta_data_df
+        criteria (list): the criteria from compile_criteria
+        mask_cache (dict): masks already worked out for this df, by
+            criterion. Passing the same dictionary when testing several
+            variants of the suitability test on one df means each
+            criterion is only tested once.
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): i) the selected rows
+                                      ii) a report of how many rows fail
+                                          each criterion and how many are
+                                          eliminated by it after the
+                                          criteria before it
+    """
+    mask_cache = {} if mask_cache is None else mask_cache
+    masks = []
+    for criterion in criteria:
+        if criterion not in mask_cache:
+            mask_cache[criterion] = criterion_mask(df, criterion)
+        masks.append(mask_cache[criterion])
+
+    if not masks:
+        return df, pd.DataFrame(columns=["criterion", "failing",
+                                         "eliminated", "remaining"])
+    # Running product of the masks, so row i is the rows that are left
+    # after the first i+1 criteria
+    cumulative = np.logical_and.accumulate(np.vstack(masks), axis=0)
+    remaining = cumulative.sum(axis=1)
+    before = np.concatenate([[len(df)], remaining[:-1]])
+    report = pd.DataFrame({
+        "criterion": [_describe(criterion) for criterion in criteria],
+        "failing": [len(df) - mask.sum() for mask in masks],
+        "eliminated": before - remaining,
+        "remaining": remaining})
+    return df[cumulative[-1]], report
+
+
+def _describe(criterion: Criterion) -> str:
+    "Makes a short readable description of a criterion for the report"
+    value = criterion.value
+    if isinstance(value, re.Pattern):
+        value = value.pattern
+    return f"{criterion.column} {criterion.op} {value!r}"
+
+
+def only_uk_data_mask(nat_geo_series: pd.Series,
+                      geo_disag_series: pd.Series,
+                      uk_terms: list) -> pd.Series:
+    """Checks if Both of these conditions are met for every row at once
+        1) value in the national_geographical_coverage is listed in uk_terms
+        2) value in geo_disag column is FALSE
+
+    Args:
+        nat_geo_series (pd.Series): The national_geographical_coverage series
+        geo_disag_series (pd.Series): The geo_disag series
+        uk_terms (list): the terms that mean the whole of the UK
+
+    Returns:
+        pd.Series: True where both conditions are met, False otherwise.
+    """
+    return nat_geo_series.isin(uk_terms) & geo_disag_series.eq(False)
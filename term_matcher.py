@@ -0,0 +1,114 @@
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+
+class TermMatcher:
+    """Finds any of a list of terms (e.g. the proxy_terms, uk_terms or
+        geo_disag_terms from the config) in the values of a column.
+
+        The terms are escaped and built into a trie, which is written out
+        as one regex, e.g. ["UK", "United Kingdom"] becomes
+        U(?:K|nited\\ Kingdom). Terms that share a beginning are only
+        tested once and the longest term always wins, so a whole column
+        can be searched for every term in a single pass.
+
+        Use get_term_matcher rather than making a TermMatcher, so that the
+        regex for a list of terms is only built once.
+
+    Args:
+        terms (iterable): the terms to search for. Duplicates are ignored.
+        case_sensitive (bool): if False, terms match in any case
+        whole_words (bool): if True, terms only match whole words
+    """
+
+    def __init__(self, terms, case_sensitive=True, whole_words=True):
+        # Maps the text a term matches to the term as it is in the config
+        self._terms = {}
+        for term in terms:
+            key = term if case_sensitive else term.lower()
+            self._terms.setdefault(key, term)
+        self.case_sensitive = case_sensitive
+
+        trie_regex = _trie_regex(self._terms) if self._terms else "(?!)"
+        if whole_words:
+            before, after = r"(?<!\w)", r"(?!\w)"
+        else:
+            before, after = "", ""
+        flags = 0 if case_sensitive else re.IGNORECASE
+        self.pattern = re.compile(f"{before}(?:{trie_regex}){after}", flags)
+        # The same regex, with a group to get the matched term from
+        self._extract_pattern = re.compile(f"{before}({trie_regex}){after}",
+                                           flags)
+
+    def matched_term(self, series: pd.Series) -> pd.Series:
+        """Gets the first term found in each value of the series.
+
+        Returns:
+            pd.Series: the matched term as written in the terms list, or
+                NaN where no term was found
+        """
+        found = series.astype("string").str.extract(self._extract_pattern,
+                                                    expand=False)
+        if not self.case_sensitive:
+            found = found.str.lower()
+        return found.map(self._terms).astype(object)
+
+    def contains(self, series: pd.Series) -> pd.Series:
+        "Checks if each value of the series contains any of the terms"
+        return (series.astype("string")
+                .str.contains(self.pattern, na=False)
+                .astype(bool))
+
+    def replace(self, series: pd.Series, replacement: str) -> pd.Series:
+        "Replaces every term found in the series with the replacement"
+        return series.str.replace(self.pattern, replacement, regex=True)
+
+
+def _trie_regex(terms) -> str:
+    """Builds a trie of the characters of the terms and writes it out as
+        a regex"""
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        # An empty key marks that a term ends here
+        node[""] = {}
+    return _node_regex(trie)
+
+
+def _node_regex(node: dict) -> str:
+    branches = [re.escape(char) + _node_regex(child)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1:
+        regex = branches[0]
+    else:
+        regex = "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # A term ends here, but longer terms carry on: they are optional
+        regex = f"(?:{regex})?"
+    return regex
+
+
+@lru_cache(maxsize=None)
+def _cached_matcher(terms: tuple, case_sensitive: bool, whole_words: bool):
+    return TermMatcher(terms, case_sensitive, whole_words)
+
+
+def get_term_matcher(terms, case_sensitive=True, whole_words=True):
+    """Gets the TermMatcher for a list of terms, building it only the first
+        time it is asked for.
+
+    Args:
+        terms (iterable): the terms to search for
+        case_sensitive (bool): if False, terms match in any case
+        whole_words (bool): if True, terms only match whole words
+
+    Returns:
+        TermMatcher: the matcher for the terms
+    """
+    return _cached_matcher(tuple(terms), case_sensitive, whole_words)
@@ -0,0 +1,28 @@
+from decisions import auto_decision
+
+AREAS = {"Asia": "142", "Africa": "2", "Central African Republic": "140",
+         "Europe": "150", "Western Asia": "145"}
+
+
+def test_same_name_is_accepted():
+    assert auto_decision("ASIA.", [("Asia", 100), ("Western Asia", 100)],
+                         AREAS, 95, 5) == (
+        "142", "Automatically matched; same as the SDMX name")
+
+
+def test_name_inside_the_value_is_not_accepted():
+    # Asia is found whole inside the value, so it ranks first with a
+    # partial ratio of 100, but it is not the same place
+    for value, matches in [
+            ("Asia, regional", [("Asia", 100), ("Western Asia", 75)]),
+            ("Central African Rep.", [("Africa", 100),
+                                      ("Central African Republic", 90)]),
+            ("Europe, regional", [("Europe", 100), ("Asia", 50)])]:
+        assert auto_decision(value, matches, AREAS, 95, 5) is None
+
+
+def test_close_whole_match_is_accepted():
+    assert auto_decision("Republic Central African",
+                         [("Africa", 100), ("Central African Republic", 95)],
+                         AREAS, 95, 5) == (
+        "140", "Automatically matched; scored 100%")
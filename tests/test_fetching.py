@@ -0,0 +1,114 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+import fetching
+from fetching import HTTPCache, fetch_many
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves small csvs. /flaky-N.csv fails with 500 the first N times it
+        is asked for, /broken.csv always fails with 500, /missing.csv is
+        404 and /slow-S.csv waits S tenths of a second before answering."""
+
+    requests_made = Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.requests_made[self.path] += 1
+            count = self.requests_made[self.path]
+        name = self.path.strip("/").rsplit(".", 1)[0]
+        if name == "missing":
+            return self._reply(404)
+        if name == "broken":
+            return self._reply(500)
+        if name.startswith("flaky-") and count <= int(name.split("-")[1]):
+            return self._reply(500)
+        if name.startswith("slow-"):
+            threading.Event().wait(int(name.split("-")[1]) / 10)
+        self._reply(200, f"name\n{name}\n")
+
+    def _reply(self, status, body=""):
+        body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.requests_made.clear()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    "Records the backoff waits instead of waiting"
+    waits = []
+    monkeypatch.setattr(fetching.time, "sleep", waits.append)
+    return waits
+
+
+@pytest.fixture
+def read_csv(tmp_path):
+    cache = HTTPCache(cache_dir=str(tmp_path))
+    return lambda url: pd.read_csv(cache.fetch(url))
+
+
+def test_server_errors_are_retried_with_backoff(server, sleeps, read_csv):
+    url = server + "flaky-2.csv"
+    [result] = fetch_many([url], read_csv, retries=3, backoff=0.5)
+
+    assert result.error is None
+    assert result.value.name.tolist() == ["flaky-2"]
+    assert StandInHandler.requests_made["/flaky-2.csv"] == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_error_is_returned_after_the_last_retry(server, sleeps, read_csv):
+    [result] = fetch_many([server + "broken.csv"], read_csv, retries=2,
+                          backoff=0.1)
+
+    assert result.value is None
+    assert isinstance(result.error, requests.HTTPError)
+    assert result.error.response.status_code == 500
+    assert StandInHandler.requests_made["/broken.csv"] == 3
+    assert sleeps == [0.1, 0.2]
+
+
+def test_not_found_is_reported_without_retrying(server, sleeps, read_csv):
+    [result] = fetch_many([server + "missing.csv"], read_csv, retries=3)
+
+    assert isinstance(result.error, requests.HTTPError)
+    assert result.error.response.status_code == 404
+    assert StandInHandler.requests_made["/missing.csv"] == 1
+    assert sleeps == []
+
+
+def test_results_are_in_the_order_of_the_urls(server, sleeps, read_csv):
+    # The first URLs answer last, so they finish out of order
+    names = ["slow-3", "slow-2", "missing", "slow-1", "slow-0"]
+    urls = [server + name + ".csv" for name in names]
+    results = fetch_many(urls, read_csv, max_workers=len(urls))
+
+    assert [result.url for result in results] == urls
+    assert [result.error is None for result in results] == [
+        True, True, False, True, True]
+    assert [result.value.name[0] for result in results
+            if result.error is None] == ["slow-3", "slow-2", "slow-1",
+                                         "slow-0"]
@@ -0,0 +1,38 @@
+import pandas as pd
+
+import main
+from decisions import DecisionJournal
+from pipeline import RunContext, load_config
+
+
+def test_stopped_review_carries_on(tmp_path, monkeypatch):
+    config = load_config("config.yml")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "inputs").mkdir()
+    assist = {**config['code_mapping_assist'], 'review_dimension': "Sex"}
+    config = {**config, 'manually_choose_code_mapping': True,
+              'intermediate_outputs_needed': False,
+              'code_mapping_assist': assist}
+    # Female was chosen again before the review session was stopped
+    DecisionJournal(main.in_path(assist['journal_file'])).append(
+        "Sex", "Female", "F", "Matching SDG value was manually chosen")
+    asked = []
+
+    def choose(column_value, possible_matches, code_name_dict):
+        asked.append(column_value)
+        return "M", "Matching SDG value was manually chosen"
+
+    monkeypatch.setattr(main, "suggest_dsd_value", choose)
+    val_col_pairs_df = pd.DataFrame({
+        "column_name": ["Sex", "Sex", "Sex"],
+        "column_value": ["Female", "Males", "Males"],
+        "sdmx_code": None, "comments": None})
+    outputs = main.suggest_codes(
+        RunContext(config), val_col_pairs_df,
+        {"Sex": {"Female": "F", "Male": "M"}},
+        pd.DataFrame(columns=["column_name", "column_value", "rank",
+                              "sdmx_name", "sdmx_code", "score"]))
+
+    assert asked == ["Males"]
+    assert outputs["chosen_values_df"].sdmx_code.tolist() == [
+        "'F'", "'M'", "'M'"]
@@ -0,0 +1,133 @@
+import pandas as pd
+
+# The problems that are looked for in the mappings
+ISSUES = {
+    "quoted": "the code is wrapped in quotes",
+    "no_code": "no SDMX code was chosen",
+    "unmapped_dimension": "the SDMX concept was not found in the DSD",
+    "uncoded_dimension": "the SDMX concept has no codelist in the DSD",
+    "invalid_code": "the code is not in the codelist of the dimension",
+    "unknown_concept": "the concept ID is not in the DSD",
+    "duplicate_text": "the SDG text is mapped more than once",
+}
+REPORT_COLS = ["mapping", "row", "Text", "Dimension", "Value", "issue",
+               "description"]
+QUOTES = "'\""
+
+
+def _strip_quotes(values: pd.Series) -> pd.Series:
+    return values.str.strip().str.strip(QUOTES).str.strip()
+
+
+def _issue_rows(mapping, df: pd.DataFrame, masks: dict) -> list:
+    "Makes the report rows of each issue from its mask over df"
+    frames = []
+    for issue, mask in masks.items():
+        if not mask.any():
+            continue
+        rows = df[mask]
+        frames.append(pd.DataFrame({
+            "mapping": mapping,
+            "row": rows.index,
+            "Text": rows.Text.to_numpy(),
+            "Dimension": (rows.Dimension.to_numpy()
+                          if "Dimension" in rows else None),
+            "Value": rows.Value.to_numpy(),
+            "issue": issue,
+            "description": ISSUES[issue]}))
+    return frames
+
+
+def validate_code_mapping(code_mapping_df: pd.DataFrame,
+                          codelist_codes: dict) -> list:
+    """Checks every row of the code mapping at once. The codes are joined
+        with a table of every (dimension, code) pair in the DSD, so each
+        code is checked against the codelist of its own dimension.
+
+    Args:
+        code_mapping_df (pd.DataFrame): Text, Dimension and Value columns
+        codelist_codes (dict): concept ID --> codes of its codelist (None
+            for uncoded concepts)
+
+    Returns:
+        list: dataframes of the rows with each issue
+    """
+    values = code_mapping_df.Value.astype(str)
+    codes = _strip_quotes(values)
+    dimensions = code_mapping_df.Dimension
+
+    valid_pairs = pd.DataFrame(
+        [(dimension, code)
+         for dimension, dimension_codes in codelist_codes.items()
+         if dimension_codes is not None
+         for code in dimension_codes],
+        columns=["Dimension", "code"]).drop_duplicates()
+    valid_pairs["valid"] = True
+    checked = (pd.DataFrame({"Dimension": dimensions.to_numpy(),
+                             "code": codes.to_numpy()})
+               .merge(valid_pairs, on=["Dimension", "code"], how="left"))
+    is_valid = checked.valid.fillna(False).to_numpy(dtype=bool)
+
+    coded = {dimension for dimension, dimension_codes
+             in codelist_codes.items() if dimension_codes is not None}
+    known = dimensions.isin(codelist_codes.keys()).to_numpy()
+    is_coded = dimensions.isin(coded).to_numpy()
+    no_code = codes.eq("None").to_numpy()
+
+    masks = {
+        "quoted": codes.ne(values.str.strip()).to_numpy(),
+        "no_code": no_code,
+        "unmapped_dimension": ~known,
+        "uncoded_dimension": known & ~is_coded,
+        "invalid_code": is_coded & ~no_code & ~is_valid,
+        "duplicate_text": code_mapping_df.duplicated(subset=["Text",
+                                                             "Dimension"],
+                                                     keep=False).to_numpy(),
+    }
+    return _issue_rows("code_mapping", code_mapping_df, masks)
+
+
+def validate_concept_mapping(column_mapping_df: pd.DataFrame,
+                             concept_ids) -> list:
+    """Checks every row of the concept (column) mapping at once.
+
+    Args:
+        column_mapping_df (pd.DataFrame): Text and Value (concept ID)
+            columns
+        concept_ids (iterable): every concept ID in the DSD
+
+    Returns:
+        list: dataframes of the rows with each issue
+    """
+    values = column_mapping_df.Value.astype(str)
+    concepts = _strip_quotes(values)
+    masks = {
+        "quoted": concepts.ne(values.str.strip()).to_numpy(),
+        "unknown_concept": ~concepts.isin(set(concept_ids)).to_numpy(),
+        "duplicate_text": column_mapping_df.Text.duplicated(keep=False)
+                                                .to_numpy(),
+    }
+    return _issue_rows("concept_mapping", column_mapping_df, masks)
+
+
+def validate_mappings(code_mapping_df: pd.DataFrame,
+                      column_mapping_df: pd.DataFrame,
+                      dsd_index) -> pd.DataFrame:
+    """Checks the code and concept mappings against the DSD.
+
+    Args:
+        code_mapping_df (pd.DataFrame): the code mapping
+        column_mapping_df (pd.DataFrame): the concept mapping
+        dsd_index (DSDIndex): the parsed DSD
+
+    Returns:
+        pd.DataFrame: a row for each problem found, with REPORT_COLS. row
+            is the index of the problem row in its mapping.
+    """
+    frames = (validate_code_mapping(code_mapping_df,
+                                    dsd_index.codes_by_concept_id())
+              + validate_concept_mapping(column_mapping_df,
+                                         dsd_index.concept_ids().values()))
+    if not frames:
+        return pd.DataFrame(columns=REPORT_COLS)
+    return pd.concat(frames, ignore_index=True)[REPORT_COLS]
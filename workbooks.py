@@ -0,0 +1,104 @@
+import os
+import pickle
+
+import pandas as pd
+
+from artifacts import file_hash
+
+# Bump this if the way workbooks are parsed changes, so old cached sheets
+# are not loaded
+CACHE_VERSION = 1
+
+# The parsed first sheet of each workbook read in this process, by
+# (path, modification time, size), so a workbook read by several stages
+# is not even hashed again unless it has changed
+_parsed_sheets = {}
+
+
+class ManualWorkbookError(Exception):
+    """Raised when a manually edited workbook is missing, cannot be read,
+        or does not have the columns that are needed."""
+
+
+def _parse_sheet(path) -> pd.DataFrame:
+    """Reads every column of the first sheet of a workbook. openpyxl is
+        used in read-only mode, which streams the rows rather than loading
+        the whole workbook."""
+    try:
+        return pd.read_excel(path, sheet_name=0, engine="openpyxl")
+    except Exception as ex:
+        raise ManualWorkbookError(f"{path} could not be read. Check that "
+                                  "it is an Excel workbook and that "
+                                  f"openpyxl is installed. {ex}") from ex
+
+
+def load_sheet(path, cache_dir) -> pd.DataFrame:
+    """Gets the first sheet of a manually edited workbook. It is parsed
+        once for each version of the workbook (by the hash of its
+        contents), and the parsed sheet is kept in cache_dir, so later
+        runs do not read the workbook again until it is edited.
+
+    Args:
+        path (str): path of the workbook
+        cache_dir (str): folder in which parsed sheets are kept
+
+    Raises:
+        ManualWorkbookError: if the workbook does not exist or cannot be
+            read
+
+    Returns:
+        pd.DataFrame: every column of the sheet. It is shared, so should
+            not be changed; select the columns needed from it.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as ex:
+        raise ManualWorkbookError(f"{path} could not be found. Check the "
+                                  "file name in the config.") from ex
+    version = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if version in _parsed_sheets:
+        return _parsed_sheets[version]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    sheet_path = os.path.join(cache_dir, f"{file_hash(path)}"
+                                         f".v{CACHE_VERSION}.pkl")
+    sheet_df = None
+    if os.path.exists(sheet_path):
+        try:
+            with open(sheet_path, "rb") as sheet_file:
+                sheet_df = pickle.load(sheet_file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            sheet_df = None
+    if sheet_df is None:
+        sheet_df = _parse_sheet(path)
+        temp_path = f"{sheet_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as sheet_file:
+            pickle.dump(sheet_df, sheet_file)
+        os.replace(temp_path, sheet_path)
+    _parsed_sheets[version] = sheet_df
+    return sheet_df
+
+
+def select_columns(path, cache_dir, wanted_cols: list) -> pd.DataFrame:
+    """Gets some of the columns of the first sheet of a manually edited
+        workbook, from the parsed sheet (see load_sheet).
+
+    Args:
+        path (str): path of the workbook
+        cache_dir (str): folder in which parsed sheets are kept
+        wanted_cols (list): the names of the columns needed
+
+    Raises:
+        ManualWorkbookError: if the workbook cannot be read or any of the
+            columns is not in it
+
+    Returns:
+        pd.DataFrame: a copy of the wanted columns, which can be changed
+    """
+    sheet_df = load_sheet(path, cache_dir)
+    missing = [col for col in wanted_cols if col not in sheet_df.columns]
+    if missing:
+        raise ManualWorkbookError(f"{path} does not have the columns "
+                                  f"{missing}. Its columns are "
+                                  f"{list(sheet_df.columns)}")
+    return sheet_df[list(wanted_cols)].copy()
@@ -0,0 +1,161 @@
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    pyarrow = None
+
+# The formats intermediate outputs can be written in, with their file
+# extension
+INTERMEDIATE_FORMATS = {"parquet": ".parquet",
+                        "feather": ".feather",
+                        "csv": ".csv"}
+
+
+def _tmp_path(path):
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _arrow_safe(df: pd.DataFrame) -> pd.DataFrame:
+    """Makes the columns that mix types (e.g. disaggregation values that
+        are numbers in one csv and text in another) into strings, which
+        Arrow needs as every column must have one type"""
+    mixed = [col for col in df.columns
+             if df[col].dtype == object
+             and pd.api.types.infer_dtype(df[col], skipna=True)
+             .startswith("mixed")]
+    if not mixed:
+        return df
+    return df.astype({col: "string" for col in mixed})
+
+
+class OutputWriter:
+    """Writes the outputs of the pipeline. There are three kinds:
+
+        intermediate outputs, which are only written for quality checks
+            when intermediate_outputs_needed is on, are written as Parquet
+            (or Feather) by default, which is much faster than csv and
+            keeps the column types
+        mapping tables, such as code_mapping.csv and concept_mapping.csv,
+            are streamed to the file in chunks of rows
+        Excel files, which are only made where people need to edit them,
+            are written with openpyxl's write-only mode, which does not
+            build the whole workbook in memory
+
+        Every file is written to a temporary file first and then moved
+        into place, so an output is never left half written.
+
+    Args:
+        output_dir (str): the folder outputs are written to
+        intermediate_format (str): one of INTERMEDIATE_FORMATS. If Parquet
+            or Feather is chosen but pyarrow is not installed, csv is used.
+        chunk_rows (int): how many rows of a mapping table are written at
+            a time
+    """
+
+    def __init__(self, output_dir, intermediate_format="parquet",
+                 chunk_rows=10000):
+        if intermediate_format not in INTERMEDIATE_FORMATS:
+            raise ValueError("Unknown intermediate format "
+                             f"'{intermediate_format}'. Use one of "
+                             f"{tuple(INTERMEDIATE_FORMATS)}")
+        if intermediate_format != "csv" and pyarrow is None:
+            print(f"pyarrow is not installed, so intermediate outputs are "
+                  f"written as csv rather than {intermediate_format}")
+            intermediate_format = "csv"
+        self.output_dir = output_dir
+        self.intermediate_format = intermediate_format
+        self.chunk_rows = chunk_rows
+
+    @classmethod
+    def from_config(cls, config: dict, output_dir="outputs"):
+        "Builds the writer from the output_writers section of the config"
+        writer_config = config.get('output_writers') or {}
+        return cls(output_dir,
+                   writer_config.get('intermediate_format', 'parquet'),
+                   writer_config.get('chunk_rows', 10000))
+
+    def intermediate_path(self, file_name):
+        """Gets the path an intermediate output is written to: file_name
+            in the output folder, with the extension of the format"""
+        stem = os.path.splitext(file_name)[0]
+        return os.path.join(self.output_dir,
+                            stem + INTERMEDIATE_FORMATS
+                            [self.intermediate_format])
+
+    def write_intermediate(self, df: pd.DataFrame, file_name,
+                           **csv_kwargs) -> str:
+        """Writes an intermediate output in the intermediate format.
+
+        Args:
+            df (pd.DataFrame): the dataframe to write, with its index
+            file_name (str): the name of the file from the config. Its
+                extension is replaced with that of the format.
+            csv_kwargs: passed to to_csv, if the format is csv
+
+        Returns:
+            str: the path of the file written
+        """
+        path = self.intermediate_path(file_name)
+        tmp_path = _tmp_path(path)
+        if self.intermediate_format == "parquet":
+            _arrow_safe(df).to_parquet(tmp_path)
+        elif self.intermediate_format == "feather":
+            # Feather cannot store an index, so it is kept as columns
+            _arrow_safe(df.reset_index()).to_feather(tmp_path)
+        else:
+            df.to_csv(tmp_path, **csv_kwargs)
+        os.replace(tmp_path, path)
+        return path
+
+    def write_table(self, df: pd.DataFrame, path, sep="\t") -> str:
+        """Streams a table to a delimited text file, without its index, a
+            chunk of rows at a time.
+
+        Args:
+            df (pd.DataFrame): the table, e.g. the code mapping
+            path (str): the path of the file
+            sep (str): the delimiter, a tab by default as for the mappings
+
+        Returns:
+            str: the path of the file written
+        """
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, "w", newline="", encoding="utf-8") as out_file:
+            # At least one chunk, so an empty table still has its header
+            for start in range(0, max(len(df), 1), self.chunk_rows):
+                (df.iloc[start:start + self.chunk_rows]
+                 .to_csv(out_file, sep=sep, index=False, header=start == 0))
+        os.replace(tmp_path, path)
+        return path
+
+    def write_excel(self, df: pd.DataFrame, path) -> str:
+        """Writes a dataframe, with its index, to the first sheet of an
+            Excel workbook in openpyxl's write-only mode, one row at a
+            time.
+
+        Args:
+            df (pd.DataFrame): the dataframe, e.g. the chosen SDMX codes
+                for manual correction
+            path (str): the path of the workbook (.xlsx)
+
+        Returns:
+            str: the path of the file written
+        """
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Sheet1")
+        # As to_excel, the index is written as the first column, with a
+        # blank header if it has no name
+        sheet.append(["" if name is None else str(name)
+                      for name in [df.index.name, *df.columns]])
+        for row in df.itertuples(name=None):
+            sheet.append([None if pd.isna(value) else value
+                          for value in row])
+        tmp_path = _tmp_path(path)
+        workbook.save(tmp_path)
+        os.replace(tmp_path, path)
+        return path